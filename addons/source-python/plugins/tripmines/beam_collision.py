@@ -0,0 +1,172 @@
+from array import array
+
+from .spatial import SpatialHash
+
+
+# Player hull, relative to the origin (height is taken per player)
+HULL_HALF_WIDTH = 16.0
+
+
+# Tick-based alternative to env_beam touch outputs. Active beam segments
+# are kept in flat arrays (start point, direction and inverse direction per
+# slot), and all players are tested against them in one batched
+# segment-vs-AABB pass, with a uniform grid skipping far-away pairs.
+class BeamCollisionEngine:
+    def __init__(self, cell_size):
+        self._grid = SpatialHash(cell_size)
+
+        self._slots = {}
+        self._keys = []
+        self._free_slots = []
+
+        self._start_x = array('d')
+        self._start_y = array('d')
+        self._start_z = array('d')
+        self._dir_x = array('d')
+        self._dir_y = array('d')
+        self._dir_z = array('d')
+        self._inv_x = array('d')
+        self._inv_y = array('d')
+        self._inv_z = array('d')
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, key):
+        return key in self._slots
+
+    def add(self, key, start, end):
+        self.remove(key)
+
+        if self._free_slots:
+            slot = self._free_slots.pop()
+            self._keys[slot] = key
+        else:
+            slot = len(self._keys)
+            self._keys.append(key)
+            for values in (
+                    self._start_x, self._start_y, self._start_z,
+                    self._dir_x, self._dir_y, self._dir_z,
+                    self._inv_x, self._inv_y, self._inv_z):
+
+                values.append(0.0)
+
+        direction = (end[0] - start[0], end[1] - start[1], end[2] - start[2])
+        self._start_x[slot], self._start_y[slot], self._start_z[slot] = start
+        self._dir_x[slot], self._dir_y[slot], self._dir_z[slot] = direction
+        self._inv_x[slot], self._inv_y[slot], self._inv_z[slot] = (
+            1.0 / component if component else 0.0 for component in direction)
+
+        self._slots[key] = slot
+        self._grid.insert_segment(slot, start, end)
+
+    def remove(self, key):
+        slot = self._slots.pop(key, None)
+        if slot is None:
+            return
+
+        self._grid.remove_segment(slot)
+        self._keys[slot] = None
+        self._free_slots.append(slot)
+
+    def clear(self):
+        self._grid.clear()
+        self._slots.clear()
+        self._keys.clear()
+        self._free_slots.clear()
+
+        for values in (
+                self._start_x, self._start_y, self._start_z,
+                self._dir_x, self._dir_y, self._dir_z,
+                self._inv_x, self._inv_y, self._inv_z):
+
+            del values[:]
+
+    def collide(self, xs, ys, zs, heights):
+        """Return {key: player number} for every beam crossed by a player.
+
+        Players are given as parallel lists of origin coordinates and hull
+        heights; if several players cross the same beam, the first one wins.
+        """
+        if not self._slots:
+            return {}
+
+        start_x = self._start_x
+        start_y = self._start_y
+        start_z = self._start_z
+        dir_x = self._dir_x
+        dir_y = self._dir_y
+        dir_z = self._dir_z
+        inv_x = self._inv_x
+        inv_y = self._inv_y
+        inv_z = self._inv_z
+        keys = self._keys
+        iter_candidates = self._grid.iter_segment_candidates
+
+        hits = {}
+        for number, (x, y, z, height) in enumerate(zip(xs, ys, zs, heights)):
+            min_x = x - HULL_HALF_WIDTH
+            max_x = x + HULL_HALF_WIDTH
+            min_y = y - HULL_HALF_WIDTH
+            max_y = y + HULL_HALF_WIDTH
+            min_z = z
+            max_z = z + height
+
+            for slot in iter_candidates(
+                    (min_x, min_y, min_z), (max_x, max_y, max_z)):
+
+                key = keys[slot]
+                if key in hits:
+                    continue
+
+                t_enter = 0.0
+                t_exit = 1.0
+
+                origin = start_x[slot]
+                if dir_x[slot]:
+                    t1 = (min_x - origin) * inv_x[slot]
+                    t2 = (max_x - origin) * inv_x[slot]
+                    if t1 > t2:
+                        t1, t2 = t2, t1
+                    if t1 > t_enter:
+                        t_enter = t1
+                    if t2 < t_exit:
+                        t_exit = t2
+                    if t_enter > t_exit:
+                        continue
+                elif origin < min_x or origin > max_x:
+                    continue
+
+                origin = start_y[slot]
+                if dir_y[slot]:
+                    t1 = (min_y - origin) * inv_y[slot]
+                    t2 = (max_y - origin) * inv_y[slot]
+                    if t1 > t2:
+                        t1, t2 = t2, t1
+                    if t1 > t_enter:
+                        t_enter = t1
+                    if t2 < t_exit:
+                        t_exit = t2
+                    if t_enter > t_exit:
+                        continue
+                elif origin < min_y or origin > max_y:
+                    continue
+
+                origin = start_z[slot]
+                if dir_z[slot]:
+                    t1 = (min_z - origin) * inv_z[slot]
+                    t2 = (max_z - origin) * inv_z[slot]
+                    if t1 > t2:
+                        t1, t2 = t2, t1
+                    if t1 > t_enter:
+                        t_enter = t1
+                    if t2 < t_exit:
+                        t_exit = t2
+                    if t_enter > t_exit:
+                        continue
+                elif origin < min_z or origin > max_z:
+                    continue
+
+                hits[key] = number
+
+        return hits
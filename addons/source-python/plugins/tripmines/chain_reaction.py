@@ -0,0 +1,65 @@
+from collections import deque
+
+
+# Graph of mines that are close enough to set each other off.
+# Edges are added and removed incrementally as mines are planted and
+# destroyed, so resolving a cascade only visits the mines that are in it.
+class NeighbourGraph:
+    def __init__(self, spatial):
+        self.spatial = spatial
+        self.radius = 0
+
+        self._neighbours = {}
+
+    def __len__(self):
+        return len(self._neighbours)
+
+    def add(self, key):
+        if self.radius <= 0:
+            return
+
+        graph = self._neighbours
+        neighbours = set(
+            neighbour for neighbour in self.spatial.iter_within_radius(
+                self.spatial.get_point(key), self.radius)
+            if neighbour in graph
+        )
+
+        graph[key] = neighbours
+        for neighbour in neighbours:
+            graph[neighbour].add(key)
+
+    def remove(self, key):
+        for neighbour in self._neighbours.pop(key, ()):
+            self._neighbours[neighbour].discard(key)
+
+    def clear(self):
+        self._neighbours.clear()
+
+    def rebuild(self, radius):
+        self.clear()
+        self.radius = radius
+
+        for key in self.spatial.iter_point_keys():
+            self.add(key)
+
+    def get_cascade(self, key, predicate):
+        # Breadth-first walk, returns every key set off by the given one
+        # (not including the key itself)
+        visited = {key}
+        cascade = []
+        queue = deque((key, ))
+        neighbours = self._neighbours
+        while queue:
+            for neighbour in neighbours.get(queue.popleft(), ()):
+                if neighbour in visited:
+                    continue
+
+                visited.add(neighbour)
+                if not predicate(neighbour):
+                    continue
+
+                cascade.append(neighbour)
+                queue.append(neighbour)
+
+        return cascade
@@ -1,25 +1,40 @@
+from hashlib import sha1
+
 from controlled_cvars import ControlledConfigManager
 from controlled_cvars.handlers import (
     bool_handler, float_handler, int_handler, string_handler)
+from listeners import OnConVarChanged
+from paths import PLUGIN_DATA_PATH
+from players.teams import teams_by_name
 
 from .info import info
+from .internal_events import InternalEvent
 
 
 config_manager = ControlledConfigManager(info.basename, cvar_prefix="tm_")
-config_manager.controlled_cvar(
+_cvar_names = []
+
+
+def controlled_cvar(handler, name, **kwargs):
+    # Registers the cvar and remembers its name for ConfigSnapshot
+    _cvar_names.append(name)
+    return config_manager.controlled_cvar(handler, name, **kwargs)
+
+
+controlled_cvar(
     bool_handler,
     "enable",
     default=1,
     description="Enable/Disable TripMines functionality"
 )
-config_manager.controlled_cvar(
+controlled_cvar(
     bool_handler,
     "allow_teamkill",
     default=0,
     description="Allow/Disallow team kills with trip mines "
                 "(also allows/dissalows destroying friendly mines)"
 )
-config_manager.controlled_cvar(
+controlled_cvar(
     int_handler,
     "mines_stock",
     default=3,
@@ -27,7 +42,7 @@ config_manager.controlled_cvar(
                 "0 - don't give any mines, -1 - infinite mines."
                 "(ONLY SET IT TO -1 WITH NON-ZERO mines_limit OPTION!!!)"
 )
-config_manager.controlled_cvar(
+controlled_cvar(
     int_handler,
     "mines_limit",
     default=0,
@@ -37,14 +52,14 @@ config_manager.controlled_cvar(
                 "OR for servers with infinite_mines turned on. "
                 "Set to 0 to disable."
 )
-config_manager.controlled_cvar(
+controlled_cvar(
     int_handler,
     "damage_base",
     default=120,
     description="Absolute damage amount for direct contact AND "
                 "damage falloff base for long-distance shots"
 )
-config_manager.controlled_cvar(
+controlled_cvar(
     float_handler,
     "damage_falloff_multiplier",
     default=0.25,
@@ -54,61 +69,275 @@ config_manager.controlled_cvar(
                 "a player standing 32 units away from the mine will receive "
                 "100 - 32*2 = 36 HP of damage."
 )
-config_manager.controlled_cvar(
+controlled_cvar(
+    bool_handler,
+    "chain_reaction",
+    default=0,
+    description="Enable/Disable detonating mines setting off "
+                "other active mines nearby"
+)
+controlled_cvar(
+    float_handler,
+    "chain_radius",
+    default=128.0,
+    description="Maximum distance (in units) between two mines for one "
+                "to set off the other when chain_reaction is enabled"
+)
+controlled_cvar(
     float_handler,
     "plant_distance",
     default=80.0,
     description="Maximum distance (in units) between a player and a surface "
                 "to plant the mine"
 )
-config_manager.controlled_cvar(
+controlled_cvar(
+    float_handler,
+    "min_spacing",
+    default=32.0,
+    description="Minimum distance (in units) between a new mine and "
+                "any other planted mine. Set to 0 to disable."
+)
+controlled_cvar(
+    string_handler,
+    "detection_mode",
+    default="touch",
+    description="How beams detect players crossing them: "
+                "'touch' - env_beam touch outputs, "
+                "'trace' - test every beam against player bounding boxes "
+                "once per tick. Applies to mines activated after the change."
+)
+controlled_cvar(
+    float_handler,
+    "attempt_rate",
+    default=4.0,
+    description="How many plant attempts (+tripmine or TAB+E) per second "
+                "a player can make on average, excess attempts are ignored. "
+                "Set to 0 to disable."
+)
+controlled_cvar(
+    int_handler,
+    "attempt_burst",
+    default=4,
+    description="How many plant attempts a player can make in a quick "
+                "succession before attempt_rate kicks in"
+)
+controlled_cvar(
+    float_handler,
+    "denial_message_window",
+    default=2.0,
+    description="Time (in seconds) during which the same plant denial "
+                "message is not repeated to a player"
+)
+controlled_cvar(
     bool_handler,
     "remove_on_death",
     default=1,
     description="Enable/Disable removing planted mines on owner's death"
 )
-config_manager.controlled_cvar(
+controlled_cvar(
     float_handler,
     "plant_timeout",
     default=1,
     description="Timeout (in seconds) after the mine has been planted "
                 "before player can plant another mine"
 )
-config_manager.controlled_cvar(
+controlled_cvar(
     float_handler,
     "activation_delay",
     default=2.0,
     description="How much time (in seconds) does it take for the mine "
                 "to activate"
 )
-config_manager.controlled_cvar(
+controlled_cvar(
     float_handler,
     "beep_interval",
     default=4.0,
     description="Time (in seconds) after the mine has beeped "
                 "before it beeps again"
 )
-config_manager.controlled_cvar(
+controlled_cvar(
     string_handler,
     "plant_sound",
     default="weapons/slam/mine_mode.wav",
     description="Sound to play when the mine is planted, "
                 "leave empty to disable"
 )
-config_manager.controlled_cvar(
+controlled_cvar(
     string_handler,
     "activation_sound",
     default="buttons/button14.wav",
     description="Sound to play when the mine is activated, "
                 "leave empty to disable"
 )
-config_manager.controlled_cvar(
+controlled_cvar(
     string_handler,
     "beep_sound",
     default="buttons/button17.wav",
     description="Sound to play when the mine beeps, leave empty to disable"
 )
-config_manager.controlled_cvar(
+controlled_cvar(
+    float_handler,
+    "explosion_effect_radius",
+    default=2048.0,
+    description="Only send explosion effects and sounds to players within "
+                "this distance (in units) from the mine. "
+                "Set to 0 to send them to everybody."
+)
+controlled_cvar(
+    float_handler,
+    "plant_sound_radius",
+    default=1024.0,
+    description="Only send the plant sound to players within this distance "
+                "(in units) from the mine. Set to 0 to send it to everybody."
+)
+controlled_cvar(
+    float_handler,
+    "activation_sound_radius",
+    default=1024.0,
+    description="Only send the activation sound to players within this "
+                "distance (in units) from the mine. "
+                "Set to 0 to send it to everybody."
+)
+controlled_cvar(
+    float_handler,
+    "beep_sound_radius",
+    default=768.0,
+    description="Only send beeps to players within this distance (in units) "
+                "from the mine. Set to 0 to send them to everybody. "
+                "Beeps of mines close to each other that are due in the same "
+                "tick are merged into one."
+)
+controlled_cvar(
+    bool_handler,
+    "transmit_culling",
+    default=0,
+    description="Enable/Disable only networking mine entities (prop, beam "
+                "and beam target) to players close enough to them"
+)
+controlled_cvar(
+    float_handler,
+    "transmit_radius",
+    default=3072.0,
+    description="With transmit_culling enabled, players only receive mines "
+                "that are within this distance (in units) from them"
+)
+controlled_cvar(
+    float_handler,
+    "transmit_enemy_radius",
+    default=0.0,
+    description="With transmit_culling enabled, players only receive "
+                "enemy mines within this distance (in units) from them. "
+                "Set to 0 to use transmit_radius."
+)
+controlled_cvar(
+    float_handler,
+    "transmit_move_threshold",
+    default=128.0,
+    description="How far (in units) a player has to move before the set "
+                "of mines they receive is rebuilt"
+)
+controlled_cvar(
+    int_handler,
+    "pool_size",
+    default=16,
+    description="Maximum number of hidden mine entity sets (prop, beam and "
+                "beam target) to keep spawned for reuse. "
+                "Set to 0 to disable pooling."
+)
+controlled_cvar(
+    float_handler,
+    "work_budget_ms",
+    default=1.0,
+    description="Maximum time (in milliseconds) per tick to spend on queued "
+                "entity spawns and removals"
+)
+controlled_cvar(
+    int_handler,
+    "work_budget_ops",
+    default=16,
+    description="Maximum number of queued entity spawns and removals "
+                "to process per tick"
+)
+controlled_cvar(
+    bool_handler,
+    "stats_enable",
+    default=1,
+    description="Enable/Disable recording per-player mine stats "
+                "to a local SQLite database"
+)
+controlled_cvar(
+    int_handler,
+    "stats_queue_size",
+    default=4096,
+    description="Maximum number of stat records waiting to be written; "
+                "records are dropped while the queue is full"
+)
+controlled_cvar(
+    int_handler,
+    "stats_batch_size",
+    default=256,
+    description="Number of queued stat records to write in one transaction"
+)
+controlled_cvar(
+    float_handler,
+    "stats_flush_interval",
+    default=5.0,
+    description="Maximum time (in seconds) stat records may wait in memory "
+                "before they are written"
+)
+controlled_cvar(
+    bool_handler,
+    "metrics_enable",
+    default=0,
+    description="Enable/Disable sending counters, gauges and hook timings "
+                "to a statsd server (turns profiling on)"
+)
+controlled_cvar(
+    string_handler,
+    "metrics_host",
+    default="127.0.0.1",
+    description="Host of the statsd server"
+)
+controlled_cvar(
+    int_handler,
+    "metrics_port",
+    default=8125,
+    description="UDP port of the statsd server"
+)
+controlled_cvar(
+    string_handler,
+    "metrics_prefix",
+    default="tripmines",
+    description="Prefix of every metric name, e.g. tripmines.server1"
+)
+controlled_cvar(
+    float_handler,
+    "metrics_interval",
+    default=10.0,
+    description="How often (in seconds) metrics are sent"
+)
+controlled_cvar(
+    int_handler,
+    "metrics_mtu",
+    default=1432,
+    description="Maximum size (in bytes) of a statsd packet"
+)
+controlled_cvar(
+    bool_handler,
+    "journal_enable",
+    default=0,
+    description="Enable/Disable keeping a binary journal of mine events "
+                "(plants, activations, beeps, trips, detonations, splash "
+                "hits) for every map. Takes effect on the next map."
+)
+controlled_cvar(
+    int_handler,
+    "journal_capacity",
+    default=65536,
+    description="Number of records the journal of a map can hold, "
+                "the oldest ones are overwritten after that"
+)
+controlled_cvar(
     float_handler,
     "announcement_delay",
     default=5.0,
@@ -116,5 +345,89 @@ config_manager.controlled_cvar(
                 "in the beginning of the round (-1 to disable)"
 )
 
-config_manager.write()
-config_manager.execute()
\ No newline at end of file
+# Rewriting the cfg file is the slowest part of loading the plugin, so it's
+# only done when the cvar definitions (this very file) have changed since
+# the last write or the cfg file is missing
+CONFIG_STAMP_PATH = PLUGIN_DATA_PATH / info.basename / "config.stamp"
+
+
+def is_config_outdated(stamp):
+    if not config_manager.fullpath.isfile():
+        return True
+
+    try:
+        with open(CONFIG_STAMP_PATH) as f:
+            return f.read() != stamp
+    except FileNotFoundError:
+        return True
+
+
+with open(__file__, 'rb') as f:
+    _config_stamp = sha1(f.read()).hexdigest()
+
+if is_config_outdated(_config_stamp):
+    config_manager.write()
+    with open(CONFIG_STAMP_PATH, 'w') as f:
+        f.write(_config_stamp)
+
+config_manager.execute()
+
+
+CVAR_NAMES = tuple(_cvar_names)
+
+
+# Read-only copy of every cvar value plus values derived from them.
+# Hot code reads plain attributes from it instead of going through the
+# controlled cvar handlers; it's only rebuilt when a tm_ cvar changes.
+class ConfigSnapshot:
+    __slots__ = CVAR_NAMES + (
+        'plant_sound_enabled',
+        'activation_sound_enabled',
+        'beep_sound_enabled',
+        'playable_teams',
+        'splash_radius_sqr',
+        'chain_radius_effective',
+        'trace_beams',
+    )
+
+    def __init__(self):
+        self.refresh()
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Config snapshot is read-only, "
+                             "change tm_{} cvar instead".format(name))
+
+    def refresh(self):
+        set_value = object.__setattr__
+        for name in CVAR_NAMES:
+            set_value(self, name, config_manager[name])
+
+        set_value(self, 'plant_sound_enabled', self.plant_sound != "")
+        set_value(
+            self, 'activation_sound_enabled', self.activation_sound != "")
+        set_value(self, 'beep_sound_enabled', self.beep_sound != "")
+        set_value(self, 'playable_teams', (
+            teams_by_name['t'], teams_by_name['ct']))
+
+        # Players further away than this can't receive any splash damage
+        if self.damage_falloff_multiplier > 0:
+            set_value(self, 'splash_radius_sqr', (
+                self.damage_base / self.damage_falloff_multiplier) ** 2)
+        else:
+            set_value(self, 'splash_radius_sqr', float('inf'))
+
+        set_value(self, 'chain_radius_effective', (
+            self.chain_radius if self.chain_reaction else 0))
+
+        set_value(self, 'trace_beams', self.detection_mode == "trace")
+
+config = ConfigSnapshot()
+
+
+@OnConVarChanged
+def listener_on_convar_changed(convar, old_value):
+    if not convar.name.startswith(config_manager.cvar_prefix):
+        return
+
+    config.refresh()
+    InternalEvent.fire('config_refreshed', config=config)
\ No newline at end of file
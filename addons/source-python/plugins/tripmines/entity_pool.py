@@ -0,0 +1,226 @@
+from engines.precache import Model
+from entities.constants import EntityEffects
+from entities.entity import Entity
+from filters.entities import EntityIter
+from listeners import OnLevelShutdown
+
+from mathlib import Vector
+
+from .cvars import config
+from .work_queue import work_queue
+
+
+PROP_MODEL = Model('models/weapons/w_slam.mdl')
+BEAM_MODEL = Model('sprites/laserbeam.vmt')
+
+# Where idle props wait to be reused - out of sight and out of reach
+PARK_ORIGIN = Vector(0, 0, -16000)
+
+# Every mine entity's target name starts with this, followed by its kind
+# and the slot
+TARGET_NAME_PREFIX = "_tripmines_"
+MINE_CLASSNAMES = ('prop_physics_override', 'env_beam', 'env_spark')
+
+# env_beam TouchType values
+TOUCH_TYPE_NONE = 0
+TOUCH_TYPE_PLAYERS_OR_NPCS = 3
+
+
+class MineEntities:
+    __slots__ = (
+        'slot', 'prop', 'beam', 'beam_target', 'beam_color', 'touch_type',
+        'indexes')
+
+    def __init__(self, slot):
+        self.slot = slot
+        self.beam_color = None
+        self.touch_type = TOUCH_TYPE_PLAYERS_OR_NPCS
+
+        self.prop = Entity.create("prop_physics_override")
+        self.prop.target_name = "_tripmines_prop_{}".format(slot)
+        self.prop.model = PROP_MODEL
+        self.prop.spawn_flags = 8
+        self.prop.teleport(PARK_ORIGIN, None, None)
+
+        # Make it non-solid so that the beam goes through
+        self.prop.solid_type = 6
+        self.prop.collision_group = 11
+
+        self.prop.spawn()
+        self.prop.effects |= EntityEffects.NODRAW
+
+        self.beam_target = Entity.create("env_spark")
+        self.beam_target.target_name = "_tripmines_target1_{}".format(slot)
+        self.beam_target.teleport(PARK_ORIGIN, None, None)
+        self.beam_target.spawn()
+
+        self.beam = Entity.create("env_beam")
+        self.beam.target_name = "_tripmines_beam_{}".format(slot)
+        self.beam.spawn_flags = 1
+        self.beam.teleport(PARK_ORIGIN, None, None)
+
+        self.beam.set_key_value_float('BoltWidth', 1.0)
+        self.beam.set_key_value_int('damage', 0)
+        self.beam.set_key_value_float('HDRColorScale', 1.0)
+        self.beam.set_key_value_int('life', 0)
+        self.beam.set_key_value_string(
+            'LightningStart', self.beam.target_name)
+        self.beam.set_key_value_string(
+            'LightningEnd', self.beam_target.target_name)
+        self.beam.set_key_value_int('Radius', 255)
+        self.beam.set_key_value_int('renderamt', 100)
+        self.beam.set_key_value_int('StrikeTime', 1)
+        self.beam.set_key_value_string('texture', "sprites/laserbeam.spr")
+        self.beam.set_key_value_int('TextureScroll', 35)
+        self.beam.set_key_value_int('TouchType', self.touch_type)
+
+        self.beam.model = BEAM_MODEL
+        self.beam.set_property_vector('m_vecEndPos', PARK_ORIGIN)
+
+        self.beam.spawn()
+        self.beam.call_input('TurnOff')
+
+        self.indexes = (
+            self.prop.index, self.beam.index, self.beam_target.index)
+
+    @classmethod
+    def from_existing(cls, slot, prop, beam, beam_target):
+        # Wrap entities left by the previous instance of the plugin
+        mine_entities = cls.__new__(cls)
+        mine_entities.slot = slot
+        mine_entities.prop = prop
+        mine_entities.beam = beam
+        mine_entities.beam_target = beam_target
+
+        # Unknown, so the next show_beam() sets them again
+        mine_entities.beam_color = None
+        mine_entities.touch_type = None
+
+        mine_entities.indexes = (prop.index, beam.index, beam_target.index)
+        return mine_entities
+
+    def show_prop(self, origin, angles):
+        self.prop.teleport(origin, angles, None)
+        self.prop.effects &= ~EntityEffects.NODRAW
+
+    def show_beam(self, start, end, color, touch_type):
+        self.beam_target.teleport(start, None, None)
+        self.beam.teleport(end, None, None)
+        self.beam.set_property_vector('m_vecEndPos', start)
+
+        if color != self.beam_color:
+            self.beam.set_key_value_color('rendercolor', color)
+            self.beam_color = color
+
+        if touch_type != self.touch_type:
+            self.beam.set_key_value_int('TouchType', touch_type)
+            self.touch_type = touch_type
+
+        # Without turning the beam off and on again,
+        # the output listener will never fire
+        self.beam.call_input('TurnOff')
+        self.beam.call_input('TurnOn')
+
+    def hide(self):
+        self.beam.call_input('TurnOff')
+        self.prop.effects |= EntityEffects.NODRAW
+        self.prop.teleport(PARK_ORIGIN, None, None)
+
+    def remove(self):
+        for entity in (self.prop, self.beam, self.beam_target):
+            entity.remove()
+
+
+# Hidden, pre-spawned prop/beam/target triples that are reused by mines
+# instead of creating and removing three entities on every plant and
+# detonation
+class EntityPool:
+    def __init__(self):
+        self._free = []
+        self._next_slot = 0
+
+    def __len__(self):
+        return len(self._free)
+
+    @property
+    def total_created(self):
+        return self._next_slot
+
+    def _create(self):
+        mine_entities = MineEntities(self._next_slot)
+        self._next_slot += 1
+        return mine_entities
+
+    def acquire(self):
+        if self._free:
+            return self._free.pop()
+
+        return self._create()
+
+    def release(self, mine_entities):
+        mine_entities.hide()
+
+        if len(self._free) < config.pool_size:
+            self._free.append(mine_entities)
+        else:
+            mine_entities.remove()
+
+    def _prewarm_one(self):
+        if len(self._free) < config.pool_size:
+            self._free.append(self._create())
+
+    def prewarm(self):
+        # Spawned a triple per job so that a big pool doesn't
+        # cause a frame spike
+        for i in range(config.pool_size - len(self._free)):
+            work_queue.add(self._prewarm_one)
+
+    def find_existing(self):
+        # Complete prop/beam/target triples that survived a plugin reload,
+        # by slot. Incomplete ones are removed.
+        parts_by_slot = {}
+        for entity in EntityIter(MINE_CLASSNAMES):
+            target_name = entity.target_name
+            if not target_name.startswith(TARGET_NAME_PREFIX):
+                continue
+
+            kind, _, slot = target_name[len(TARGET_NAME_PREFIX):].rpartition(
+                '_')
+
+            if not slot.isdigit():
+                continue
+
+            parts_by_slot.setdefault(int(slot), {})[kind] = entity
+
+        found = {}
+        for slot, parts in parts_by_slot.items():
+            if parts.keys() == {'prop', 'beam', 'target1'}:
+                found[slot] = MineEntities.from_existing(
+                    slot, parts['prop'], parts['beam'], parts['target1'])
+            else:
+                for entity in parts.values():
+                    entity.remove()
+
+        # New triples must not reuse target names of the found ones
+        if parts_by_slot:
+            self._next_slot = max(self._next_slot, max(parts_by_slot) + 1)
+
+        return found
+
+    def invalidate(self):
+        # Entities have already been removed by the engine
+        # (round restart, map change)
+        self._free.clear()
+
+    def clear(self):
+        for mine_entities in self._free:
+            mine_entities.remove()
+
+        self._free.clear()
+
+entity_pool = EntityPool()
+
+
+@OnLevelShutdown
+def listener_on_level_shutdown():
+    entity_pool.invalidate()
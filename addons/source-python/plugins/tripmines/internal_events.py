@@ -1,54 +1,108 @@
+from time import perf_counter
 from traceback import format_exc
 
+from commands.server import ServerCommand
 from core import echo_console
 
 
+# Handlers of every event are kept as a tuple sorted by priority (higher
+# priorities run first) that is only rebuilt on register/unregister
 class InternalEventManager(dict):
-    def register_event_handler(self, event_name, handler):
-        if event_name not in self:
-            self[event_name] = []
+    def __init__(self):
+        super().__init__()
+
+        self._priorities = {}
+        self.timing_enabled = False
+        self.timings = {}
 
-        if handler in self[event_name]:
+    def register_event_handler(self, event_name, handler, priority=0):
+        priorities = self._priorities.setdefault(event_name, {})
+        if handler in priorities:
             raise ValueError("Handler {} is already registered to "
                              "handle '{}'".format(handler, event_name))
 
-        self[event_name].append(handler)
+        # Dicts preserve insertion order and sorting is stable, so handlers
+        # of equal priority run in the order they were registered
+        priorities[handler] = priority
+        self[event_name] = tuple(sorted(
+            priorities, key=priorities.__getitem__, reverse=True))
 
     def unregister_event_handler(self, event_name, handler):
         if event_name not in self:
             raise KeyError("No '{}' event handlers are registered".format(
                 event_name))
 
-        self[event_name].remove(handler)
+        priorities = self._priorities[event_name]
+        del priorities[handler]
 
-        if not self[event_name]:
+        if priorities:
+            self[event_name] = tuple(sorted(
+                priorities, key=priorities.__getitem__, reverse=True))
+        else:
             del self[event_name]
-
-    def fire(self, event_name, event_var):
-        exceptions = []
-        for handler in self.get(event_name, ()):
-            try:
-                handler(event_var)
-            except Exception as e:
-                exceptions.append(e)
-                echo_console(format_exc())
+            del self._priorities[event_name]
+
+    def _call_timed(self, handler, event_var):
+        start_time = perf_counter()
+        try:
+            handler(event_var)
+        finally:
+            timing = self.timings.get(handler)
+            if timing is None:
+                timing = self.timings[handler] = [0, 0.0]
+
+            timing[0] += 1
+            timing[1] += perf_counter() - start_time
+
+    def fire_many(self, event_name, event_vars):
+        handlers = self.get(event_name)
+        if handlers is None:
+            return
+
+        exceptions = 0
+        timing_enabled = self.timing_enabled
+        for event_var in event_vars:
+            for handler in handlers:
+                try:
+                    if timing_enabled:
+                        self._call_timed(handler, event_var)
+                    else:
+                        handler(event_var)
+                except Exception:
+                    exceptions += 1
+                    echo_console(format_exc())
 
         if exceptions:
             echo_console("{} exceptions were raised during "
-                  "handling of '{}' event".format(len(exceptions), event_name))
+                  "handling of '{}' event".format(exceptions, event_name))
+
+    def fire(self, event_name, event_var):
+        self.fire_many(event_name, (event_var, ))
+
+    def reset_timings(self):
+        self.timings.clear()
+
+    def iter_timings(self):
+        # Slowest handlers first
+        for handler, (calls, total_time) in sorted(
+                self.timings.items(), key=lambda item: -item[1][1]):
+
+            yield handler, calls, total_time
 
 internal_event_manager = InternalEventManager()
 
 
 class InternalEvent:
-    def __init__(self, event_name):
+    def __init__(self, event_name, priority=0):
         self.event_name = event_name
+        self.priority = priority
 
     def __call__(self, handler):
         self.register(handler)
 
     def register(self, handler):
-        internal_event_manager.register_event_handler(self.event_name, handler)
+        internal_event_manager.register_event_handler(
+            self.event_name, handler, self.priority)
 
     def unregister(self, handler):
         internal_event_manager.unregister_event_handler(
@@ -57,3 +111,26 @@ class InternalEvent:
     @staticmethod
     def fire(event_name, **event_var):
         internal_event_manager.fire(event_name, event_var)
+
+    @staticmethod
+    def fire_many(event_name, event_vars):
+        internal_event_manager.fire_many(event_name, event_vars)
+
+
+@ServerCommand('tm_event_timings')
+def server_tm_event_timings(command):
+    action = command[1] if len(command) > 1 else ""
+    if action == "on":
+        internal_event_manager.timing_enabled = True
+    elif action == "off":
+        internal_event_manager.timing_enabled = False
+    elif action == "reset":
+        internal_event_manager.reset_timings()
+
+    echo_console("Internal event timing is {}".format(
+        "on" if internal_event_manager.timing_enabled else "off"))
+
+    for handler, calls, total_time in internal_event_manager.iter_timings():
+        echo_console("{:>8} calls {:>10.3f} ms total  {}.{}".format(
+            calls, total_time * 1000,
+            handler.__module__, handler.__qualname__))
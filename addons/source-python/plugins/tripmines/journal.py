@@ -0,0 +1,132 @@
+import mmap
+from struct import Struct
+
+
+JOURNAL_MAGIC = b'TMJ1'
+JOURNAL_VERSION = 1
+
+# magic, version, record size, capacity, records written in total
+HEADER_STRUCT = Struct('<4sHHIQ')
+HEADER_SIZE = 32
+TOTAL_STRUCT = Struct('<Q')
+TOTAL_OFFSET = 12
+
+# timestamp, tick, event, mine id, owner index, other entity index, damage,
+# origin
+RECORD_STRUCT = Struct('<dIBIHHHfff')
+
+# Damage is stored as an unsigned short and saturates at this value
+MAX_RECORD_DAMAGE = 0xFFFF
+
+EVENT_PLANT = 1
+EVENT_ACTIVATE = 2
+EVENT_BEEP = 3
+EVENT_TRIP = 4
+EVENT_SHOT_DOWN = 5
+EVENT_DETONATE = 6
+EVENT_DESTROY = 7
+EVENT_SPLASH_HIT = 8
+
+EVENT_NAMES = {
+    EVENT_PLANT: 'plant',
+    EVENT_ACTIVATE: 'activate',
+    EVENT_BEEP: 'beep',
+    EVENT_TRIP: 'trip',
+    EVENT_SHOT_DOWN: 'shot_down',
+    EVENT_DETONATE: 'detonate',
+    EVENT_DESTROY: 'destroy',
+    EVENT_SPLASH_HIT: 'splash_hit',
+}
+
+RECORD_FIELDS = (
+    'timestamp', 'tick', 'event', 'mine_id', 'owner_index', 'other_index',
+    'damage', 'x', 'y', 'z',
+)
+
+
+# Fixed-size records in a memory-mapped file used as a ring buffer: once
+# the capacity is reached, the oldest records are overwritten. Writing a
+# record is one struct.pack_into() plus an update of the total counter in
+# the header, no formatting and no system calls.
+class Journal:
+    def __init__(self):
+        self.path = None
+        self.capacity = 0
+        self.total = 0
+
+        self._file = None
+        self._mmap = None
+
+    @property
+    def is_open(self):
+        return self._mmap is not None
+
+    def open(self, path, capacity):
+        self.close()
+
+        size = HEADER_SIZE + RECORD_STRUCT.size * capacity
+        self._file = open(path, 'w+b')
+        self._file.truncate(size)
+        self._mmap = mmap.mmap(self._file.fileno(), size)
+
+        HEADER_STRUCT.pack_into(
+            self._mmap, 0, JOURNAL_MAGIC, JOURNAL_VERSION,
+            RECORD_STRUCT.size, capacity, 0)
+
+        self.path = path
+        self.capacity = capacity
+        self.total = 0
+
+    def close(self):
+        if self._mmap is None:
+            return
+
+        self._mmap.flush()
+        self._mmap.close()
+        self._file.close()
+        self._mmap = None
+        self._file = None
+
+    def write(self, timestamp, tick, event, mine_id, owner_index,
+              other_index=0, damage=0, x=0.0, y=0.0, z=0.0):
+
+        if self._mmap is None:
+            return
+
+        total = self.total
+        RECORD_STRUCT.pack_into(
+            self._mmap,
+            HEADER_SIZE + RECORD_STRUCT.size * (total % self.capacity),
+            timestamp, tick, event, mine_id, owner_index, other_index,
+            min(damage, MAX_RECORD_DAMAGE), x, y, z
+        )
+
+        self.total = total + 1
+        TOTAL_STRUCT.pack_into(self._mmap, TOTAL_OFFSET, self.total)
+
+journal = Journal()
+
+
+def iter_journal(path):
+    # Oldest record first; only one record is held in memory at a time
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_STRUCT.size)
+        magic, version, record_size, capacity, total = HEADER_STRUCT.unpack(
+            header)
+
+        if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION:
+            raise ValueError("{} is not a TripMines journal".format(path))
+
+        if record_size != RECORD_STRUCT.size:
+            raise ValueError("Unexpected record size {}".format(record_size))
+
+        if total <= capacity:
+            slots = range(total)
+        else:
+            first = total % capacity
+            slots = (
+                (first + number) % capacity for number in range(capacity))
+
+        for slot in slots:
+            f.seek(HEADER_SIZE + record_size * slot)
+            yield RECORD_STRUCT.unpack(f.read(record_size))
@@ -0,0 +1,202 @@
+import socket
+from collections import deque
+from threading import Event, Thread
+from traceback import format_exc
+
+from core import echo_console
+from engines.server import global_vars
+from listeners import OnTick
+
+from .cvars import config
+from .internal_events import InternalEvent
+from .profiler import profiler
+
+
+# How long unload may wait for the sender to send what's left
+STOP_TIMEOUT = 2.0
+
+
+def iter_packets(lines, mtu):
+    # Joins statsd lines with newlines into packets of at most mtu bytes
+    # (a single line longer than that is sent on its own)
+    packet = bytearray()
+    for line in lines:
+        line = line.encode('utf-8')
+        if packet and len(packet) + 1 + len(line) > mtu:
+            yield bytes(packet)
+            packet.clear()
+
+        if packet:
+            packet += b'\n'
+
+        packet += line
+
+    if packet:
+        yield bytes(packet)
+
+
+# Counters are plain dict increments on the game thread. Once per
+# metrics_interval, OnTick swaps the counter dict for an empty one, samples
+# gauges and takes deltas of profiled hook sections; everything else
+# (formatting, batching lines into MTU-sized packets and sending them) is
+# done by a background thread, so the game thread never touches a socket.
+class MetricsExporter:
+    def __init__(self):
+        self.sent_packets = 0
+        self.send_errors = 0
+
+        self._counters = {}
+        self._gauges = {}
+        self._sections = {}
+        self._next_flush_tick = 0
+        self._profiler_was_enabled = False
+
+        self._batches = deque()
+        self._wake_up = Event()
+        self._thread = None
+        self._running = False
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def increment(self, name, value=1):
+        counters = self._counters
+        counters[name] = counters.get(name, 0) + value
+
+    def register_gauge(self, name, callback):
+        self._gauges[name] = callback
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        # Hook latencies come from the profiler
+        self._profiler_was_enabled = profiler.enabled
+        profiler.enabled = True
+
+        # Counts and hook timings from before metrics were enabled don't
+        # belong to the first interval
+        self._counters = {}
+        self._get_section_deltas()
+
+        self._running = True
+        self._thread = Thread(
+            target=self._run, name="tripmines-metrics", daemon=True)
+
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+
+        self.flush()
+        self._running = False
+        self._wake_up.set()
+        self._thread.join(STOP_TIMEOUT)
+        self._thread = None
+
+        profiler.enabled = self._profiler_was_enabled
+
+    def _get_section_deltas(self):
+        deltas = []
+        for name, section in profiler.sections.items():
+            calls, total_time = self._sections.get(name, (0, 0))
+            if section.calls < calls:
+                # Profiler has been reset
+                calls, total_time = 0, 0
+
+            if section.calls > calls:
+                deltas.append((
+                    name,
+                    section.calls - calls,
+                    (section.total_time - total_time) / (
+                        section.calls - calls),
+                ))
+
+            self._sections[name] = (section.calls, section.total_time)
+
+        return deltas
+
+    def flush(self):
+        counters, self._counters = self._counters, {}
+        gauges = [(name, callback()) for name, callback in
+                  self._gauges.items()]
+
+        self._batches.append((counters, gauges, self._get_section_deltas()))
+        self._wake_up.set()
+
+    def tick(self):
+        if not config.metrics_enable:
+            if self._thread is not None:
+                self.stop()
+
+            return
+
+        if self._thread is None:
+            self.start()
+
+        tick = global_vars.tick_count
+        if tick < self._next_flush_tick:
+            return
+
+        self._next_flush_tick = tick + max(1, int(
+            config.metrics_interval / global_vars.interval_per_tick))
+
+        self.flush()
+
+    def _format(self, counters, gauges, section_deltas):
+        prefix = config.metrics_prefix
+        for name, value in counters.items():
+            yield "{}.{}:{}|c".format(prefix, name, value)
+
+        for name, value in gauges:
+            yield "{}.{}:{}|g".format(prefix, name, value)
+
+        for name, calls, mean_time in section_deltas:
+            yield "{}.hooks.{}.calls:{}|c".format(prefix, name, calls)
+            yield "{}.hooks.{}.time:{:.3f}|ms".format(
+                prefix, name, mean_time / 1e6)
+
+    def _send(self, sock, counters, gauges, section_deltas):
+        address = (config.metrics_host, config.metrics_port)
+        for packet in iter_packets(
+                self._format(counters, gauges, section_deltas),
+                config.metrics_mtu):
+
+            try:
+                sock.sendto(packet, address)
+            except OSError:
+                self.send_errors += 1
+            else:
+                self.sent_packets += 1
+
+    def _run(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        try:
+            while True:
+                self._wake_up.wait()
+                self._wake_up.clear()
+
+                while self._batches:
+                    self._send(sock, *self._batches.popleft())
+
+                if not self._running:
+                    return
+        except Exception:
+            echo_console(format_exc())
+        finally:
+            sock.close()
+
+metrics = MetricsExporter()
+
+
+@OnTick
+def listener_on_tick():
+    metrics.tick()
+
+
+@InternalEvent('unload')
+def on_unload(event_var):
+    metrics.stop()
@@ -0,0 +1,71 @@
+from engines.server import global_vars
+
+from .cvars import config
+from .trip_mine_player import player_manager
+
+
+# Live players of playable teams, gathered at most once per tick into flat
+# parallel lists so that hot paths don't go through entity properties
+# for every player on every call
+class PlayerSnapshot:
+    def __init__(self):
+        self.tick = None
+
+        self.players = []
+        self.indexes = []
+        self.teams = []
+        self.xs = []
+        self.ys = []
+        self.zs = []
+        self.heights = []
+
+    def __len__(self):
+        self.refresh()
+        return len(self.players)
+
+    def refresh(self):
+        tick = global_vars.tick_count
+        if tick == self.tick:
+            return self
+
+        players = []
+        indexes = []
+        teams = []
+        xs = []
+        ys = []
+        zs = []
+        heights = []
+        playable_teams = config.playable_teams
+        for player in player_manager.values():
+            entity = player.player
+            if entity.dead:
+                continue
+
+            team = entity.team
+            if team not in playable_teams:
+                continue
+
+            origin = entity.origin
+            players.append(player)
+            indexes.append(entity.index)
+            teams.append(team)
+            xs.append(origin.x)
+            ys.append(origin.y)
+            zs.append(origin.z)
+            heights.append(entity.maxs.z)
+
+        self.players = players
+        self.indexes = indexes
+        self.teams = teams
+        self.xs = xs
+        self.ys = ys
+        self.zs = zs
+        self.heights = heights
+        self.tick = tick
+
+        return self
+
+    def invalidate(self):
+        self.tick = None
+
+player_snapshot = PlayerSnapshot()
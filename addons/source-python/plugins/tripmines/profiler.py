@@ -0,0 +1,106 @@
+from functools import wraps
+from time import perf_counter_ns
+
+
+# Every power of two of nanoseconds is split into this many histogram buckets
+SUB_BUCKETS_BITS = 2
+SUB_BUCKETS = 1 << SUB_BUCKETS_BITS
+
+
+def get_bucket(elapsed):
+    octave = elapsed.bit_length()
+    if octave <= SUB_BUCKETS_BITS:
+        return octave << SUB_BUCKETS_BITS
+
+    sub_bucket = (elapsed >> (octave - SUB_BUCKETS_BITS - 1)) & (
+        SUB_BUCKETS - 1)
+
+    return (octave << SUB_BUCKETS_BITS) | sub_bucket
+
+
+def get_bucket_upper_bound(bucket):
+    octave = bucket >> SUB_BUCKETS_BITS
+    if octave <= SUB_BUCKETS_BITS:
+        return 1 << octave
+
+    sub_bucket = bucket & (SUB_BUCKETS - 1)
+    step = 1 << (octave - SUB_BUCKETS_BITS - 1)
+    return (1 << (octave - 1)) + (sub_bucket + 1) * step
+
+
+class ProfilerSection:
+    __slots__ = ('name', 'calls', 'total_time', 'max_time', 'histogram')
+
+    def __init__(self, name):
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.total_time = 0
+        self.max_time = 0
+        self.histogram = {}
+
+    def record(self, elapsed):
+        self.calls += 1
+        self.total_time += elapsed
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+
+        bucket = get_bucket(elapsed)
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+    def get_percentile(self, fraction):
+        # Upper bound of the histogram bucket the percentile falls into
+        if not self.calls:
+            return 0
+
+        threshold = self.calls * fraction
+        seen = 0
+        for bucket in sorted(self.histogram):
+            seen += self.histogram[bucket]
+            if seen >= threshold:
+                return min(get_bucket_upper_bound(bucket), self.max_time)
+
+        return self.max_time
+
+
+# Call counts, cumulative time and latency histograms of hot paths.
+# All times are in nanoseconds. When disabled, a profiled function only
+# costs one extra call and one attribute check.
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.sections = {}
+
+    def get_section(self, name):
+        section = self.sections.get(name)
+        if section is None:
+            section = self.sections[name] = ProfilerSection(name)
+
+        return section
+
+    def reset(self):
+        for section in self.sections.values():
+            section.reset()
+
+    def profiled(self, name):
+        section = self.get_section(name)
+
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+
+                start_time = perf_counter_ns()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    section.record(perf_counter_ns() - start_time)
+
+            return wrapper
+
+        return decorator
+
+profiler = Profiler()
@@ -0,0 +1,99 @@
+from math import floor
+
+from engines.server import global_vars
+
+from .trip_mine_player import player_manager
+
+
+# Positions of every registered player (dead players and spectators hear
+# sounds too), gathered at most once per tick and only when an effect is
+# actually emitted
+class ListenerPositions:
+    def __init__(self):
+        self.tick = None
+        self._listeners = ()
+
+    def refresh(self):
+        tick = global_vars.tick_count
+        if tick == self.tick:
+            return self._listeners
+
+        listeners = []
+        for player in player_manager.values():
+            origin = player.player.origin
+            listeners.append((player.index, origin.x, origin.y, origin.z))
+
+        self._listeners = listeners
+        self.tick = tick
+        return listeners
+
+    def invalidate(self):
+        self.tick = None
+
+    def get_within_radius(self, origin, radius):
+        ox, oy, oz = origin.x, origin.y, origin.z
+        radius_sqr = radius * radius
+
+        indexes = []
+        for index, x, y, z in self.refresh():
+            dx = x - ox
+            dy = y - oy
+            dz = z - oz
+            if dx * dx + dy * dy + dz * dz <= radius_sqr:
+                indexes.append(index)
+
+        return indexes
+
+listener_positions = ListenerPositions()
+
+
+def get_recipients(origin, radius):
+    # None stands for everybody (culling disabled)
+    if radius <= 0:
+        return None
+
+    return listener_positions.get_within_radius(origin, radius)
+
+
+def play_sound(sound, origin, radius):
+    recipients = get_recipients(origin, radius)
+    if recipients is None:
+        sound.play()
+    elif recipients:
+        # Sound.play() without recipients would play to everybody
+        sound.play(*recipients)
+
+
+# Beeps of all mines that are due in the same tick, merged into one emission
+# per area
+class BeepBatch:
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self._trip_mines = []
+
+    def __len__(self):
+        return len(self._trip_mines)
+
+    def add(self, trip_mine):
+        self._trip_mines.append(trip_mine)
+
+    def clear(self):
+        self._trip_mines.clear()
+
+    def pop_groups(self):
+        # Return the first mine of every area, the one that should beep
+        if not self._trip_mines:
+            return ()
+
+        cell_size = self.cell_size
+        groups = {}
+        for trip_mine in self._trip_mines:
+            origin = trip_mine.origin
+            groups.setdefault((
+                floor(origin.x / cell_size),
+                floor(origin.y / cell_size),
+                floor(origin.z / cell_size),
+            ), trip_mine)
+
+        self._trip_mines.clear()
+        return groups.values()
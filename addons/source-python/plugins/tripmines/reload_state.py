@@ -0,0 +1,46 @@
+import json
+from os import remove
+from time import time
+
+from paths import PLUGIN_DATA_PATH
+
+from .info import info
+
+
+RELOAD_STATE_PATH = PLUGIN_DATA_PATH / info.basename / "reload_state.json"
+
+# A snapshot older than this (in seconds) is not from a reload and is ignored
+RELOAD_STATE_MAX_AGE = 30.0
+
+
+# Mines and players are stored as plain lists, see TripMine.to_record() and
+# get_player_records() in tripmines.py
+def save_reload_state(map_name, mines, players):
+    with open(RELOAD_STATE_PATH, 'w') as f:
+        json.dump({
+            'map': map_name,
+            'time': time(),
+            'mines': mines,
+            'players': players,
+        }, f, separators=(',', ':'))
+
+
+def pop_reload_state(map_name):
+    try:
+        with open(RELOAD_STATE_PATH) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        state = None
+
+    # Whatever happens next, the snapshot must only be used once
+    remove(RELOAD_STATE_PATH)
+
+    if (state is None or
+            state['map'] != map_name or
+            time() - state['time'] > RELOAD_STATE_MAX_AGE):
+
+        return None
+
+    return state
@@ -0,0 +1,220 @@
+from math import floor
+
+
+def segment_intersects_box(start, end, mins, maxs):
+    # Slab test, all arguments are (x, y, z) tuples
+    t_enter = 0.0
+    t_exit = 1.0
+    for axis in range(3):
+        origin = start[axis]
+        direction = end[axis] - origin
+        low = mins[axis]
+        high = maxs[axis]
+
+        if direction == 0:
+            if origin < low or origin > high:
+                return False
+
+            continue
+
+        t1 = (low - origin) / direction
+        t2 = (high - origin) / direction
+        if t1 > t2:
+            t1, t2 = t2, t1
+
+        if t1 > t_enter:
+            t_enter = t1
+
+        if t2 < t_exit:
+            t_exit = t2
+
+        if t_enter > t_exit:
+            return False
+
+    return True
+
+
+# Uniform grid of mine origins (points) and beams (segments).
+# Keys are arbitrary hashable objects, coordinates are (x, y, z) tuples.
+class SpatialHash:
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+
+        self._points = {}
+        self._point_cells = {}
+        self._segments = {}
+        self._segment_cells = {}
+        self._cells_by_segment = {}
+
+    def __len__(self):
+        return len(self._points)
+
+    def _get_cell(self, point):
+        cell_size = self.cell_size
+        return (floor(point[0] / cell_size),
+                floor(point[1] / cell_size),
+                floor(point[2] / cell_size))
+
+    def _iter_box_cells(self, cells, mins, maxs):
+        # Yield keys from every occupied cell overlapping the box
+        min_x, min_y, min_z = self._get_cell(mins)
+        max_x, max_y, max_z = self._get_cell(maxs)
+
+        # Big boxes over a sparse grid: filter occupied cells instead
+        volume = (
+            (max_x - min_x + 1) * (max_y - min_y + 1) * (max_z - min_z + 1))
+        if volume > len(cells):
+            for (x, y, z), keys in cells.items():
+                if (min_x <= x <= max_x and
+                        min_y <= y <= max_y and
+                        min_z <= z <= max_z):
+
+                    yield from keys
+
+            return
+
+        for x in range(min_x, max_x + 1):
+            for y in range(min_y, max_y + 1):
+                for z in range(min_z, max_z + 1):
+                    keys = cells.get((x, y, z))
+                    if keys is not None:
+                        yield from keys
+
+    def _iter_segment_cells(self, start, end):
+        # 3D DDA: walk every cell the segment passes through
+        cell = list(self._get_cell(start))
+        end_cell = self._get_cell(end)
+        cell_size = self.cell_size
+
+        steps = []
+        t_max = []
+        t_delta = []
+        for axis in range(3):
+            direction = end[axis] - start[axis]
+            if direction > 0:
+                steps.append(1)
+                boundary = (cell[axis] + 1) * cell_size
+            elif direction < 0:
+                steps.append(-1)
+                boundary = cell[axis] * cell_size
+            else:
+                steps.append(0)
+                t_max.append(float('inf'))
+                t_delta.append(float('inf'))
+                continue
+
+            t_max.append((boundary - start[axis]) / direction)
+            t_delta.append(cell_size / abs(direction))
+
+        yield tuple(cell)
+
+        remaining = sum(abs(end_cell[axis] - cell[axis]) for axis in range(3))
+        for _ in range(remaining):
+            axis = min(
+                (axis for axis in range(3) if cell[axis] != end_cell[axis]),
+                key=t_max.__getitem__
+            )
+            cell[axis] += steps[axis]
+            t_max[axis] += t_delta[axis]
+            yield tuple(cell)
+
+    def insert_point(self, key, point):
+        self.remove_point(key)
+
+        self._points[key] = point
+        self._point_cells.setdefault(self._get_cell(point), set()).add(key)
+
+    def remove_point(self, key):
+        point = self._points.pop(key, None)
+        if point is None:
+            return
+
+        cell = self._get_cell(point)
+        keys = self._point_cells[cell]
+        keys.discard(key)
+        if not keys:
+            del self._point_cells[cell]
+
+    def insert_segment(self, key, start, end):
+        self.remove_segment(key)
+
+        cells = tuple(self._iter_segment_cells(start, end))
+        self._segments[key] = (start, end)
+        self._cells_by_segment[key] = cells
+        for cell in cells:
+            self._segment_cells.setdefault(cell, set()).add(key)
+
+    def remove_segment(self, key):
+        if self._segments.pop(key, None) is None:
+            return
+
+        for cell in self._cells_by_segment.pop(key):
+            keys = self._segment_cells[cell]
+            keys.discard(key)
+            if not keys:
+                del self._segment_cells[cell]
+
+    def remove(self, key):
+        self.remove_point(key)
+        self.remove_segment(key)
+
+    def clear(self):
+        self._points.clear()
+        self._point_cells.clear()
+        self._segments.clear()
+        self._segment_cells.clear()
+        self._cells_by_segment.clear()
+
+    def iter_point_keys(self):
+        return iter(self._points)
+
+    def get_point(self, key):
+        return self._points[key]
+
+    def get_segment(self, key):
+        return self._segments[key]
+
+    def iter_within_radius(self, center, radius):
+        cx, cy, cz = center
+        radius_sqr = radius * radius
+        points = self._points
+        for key in self._iter_box_cells(
+                self._point_cells,
+                (cx - radius, cy - radius, cz - radius),
+                (cx + radius, cy + radius, cz + radius)):
+
+            x, y, z = points[key]
+            dx = x - cx
+            dy = y - cy
+            dz = z - cz
+            if dx * dx + dy * dy + dz * dz <= radius_sqr:
+                yield key
+
+    def query_radius(self, center, radius):
+        return list(self.iter_within_radius(center, radius))
+
+    def any_within_radius(self, center, radius):
+        for key in self.iter_within_radius(center, radius):
+            return True
+
+        return False
+
+    def iter_segment_candidates(self, mins, maxs):
+        # Broad phase only: keys of segments passing through any cell the box
+        # overlaps, may repeat and may not actually intersect the box
+        return self._iter_box_cells(self._segment_cells, mins, maxs)
+
+    def query_box(self, mins, maxs):
+        checked = set()
+        result = set()
+        segments = self._segments
+        for key in self._iter_box_cells(self._segment_cells, mins, maxs):
+            if key in checked:
+                continue
+
+            checked.add(key)
+            start, end = segments[key]
+            if segment_intersects_box(start, end, mins, maxs):
+                result.add(key)
+
+        return result
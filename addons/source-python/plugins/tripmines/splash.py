@@ -0,0 +1,87 @@
+from math import floor, sqrt
+
+from .cvars import config
+from .player_snapshot import player_snapshot
+from .take_damage import take_damage
+
+
+# Applies splash damage of any number of explosions in one pass over the
+# per-tick player snapshot. Every explosion is an (origin, owner, ignore)
+# tuple, where ignore holds indexes of players that must not be hurt by it.
+# Damage dealt to the same victim by the same owner is combined into one hit,
+# credited to the explosion that contributed the most of it.
+# Returns (owner, victim, damage, killed, explosion number) for every hit.
+class SplashEngine:
+    def hurt(self, explosions):
+        snapshot = player_snapshot.refresh()
+        if not snapshot.players:
+            return ()
+
+        damage_base = config.damage_base
+        falloff = config.damage_falloff_multiplier
+        allow_teamkill = config.allow_teamkill
+        max_distance_sqr = config.splash_radius_sqr
+
+        rows = tuple(enumerate(zip(
+            snapshot.indexes, snapshot.teams,
+            snapshot.xs, snapshot.ys, snapshot.zs)))
+
+        damages = {}
+        sources = {}
+        owners = {}
+        for number, (origin, owner, ignore) in enumerate(explosions):
+            owner_index = owner.index
+            owner_team = owner.team
+            owners[owner_index] = owner
+            ox, oy, oz = origin.x, origin.y, origin.z
+
+            for slot, (index, team, x, y, z) in rows:
+                dx = x - ox
+                dy = y - oy
+                dz = z - oz
+                distance_sqr = dx * dx + dy * dy + dz * dz
+                if distance_sqr >= max_distance_sqr:
+                    continue
+
+                if index in ignore:
+                    continue
+
+                if (not allow_teamkill and
+                        index != owner_index and
+                        team == owner_team):
+
+                    continue
+
+                damage = floor(damage_base - sqrt(distance_sqr) * falloff)
+                if damage <= 0:
+                    continue
+
+                key = (slot, owner_index)
+                damages[key] = damages.get(key, 0) + damage
+                if damage > sources.get(key, (0, ))[0]:
+                    sources[key] = (damage, number)
+
+        if not damages:
+            return ()
+
+        hits = []
+        players = snapshot.players
+        for key, damage in damages.items():
+            slot, owner_index = key
+            victim = players[slot]
+
+            # Killed by a direct beam hit or by an earlier explosion
+            if victim.player.dead:
+                continue
+
+            owner = owners[owner_index]
+            take_damage(victim.player, damage, owner)
+            hits.append((
+                owner, victim, damage, victim.player.dead, sources[key][1]))
+
+        # Victims may have died
+        snapshot.invalidate()
+
+        return hits
+
+splash_engine = SplashEngine()
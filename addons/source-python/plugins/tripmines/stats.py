@@ -0,0 +1,272 @@
+from collections import deque
+from queue import Empty, Queue
+from threading import Thread
+from time import monotonic
+from traceback import format_exc
+
+from commands.server import ServerCommand
+from core import echo_console
+from listeners import OnLevelShutdown, OnTick
+from paths import PLUGIN_DATA_PATH
+
+from .cvars import config
+from .info import info
+from .internal_events import InternalEvent
+from .trip_mine_player import player_manager
+
+
+STATS_DATABASE_PATH = PLUGIN_DATA_PATH / info.basename / "stats.sqlite3"
+
+# planted - mines planted, triggered - own mines set off by touching the
+# beam, kills and damage - dealt to other players by own mines,
+# destroyed - mines of other players shot down
+STATS_COLUMNS = ('planted', 'triggered', 'kills', 'damage', 'destroyed')
+
+# How long unload may wait for the writer to store what's left
+STOP_TIMEOUT = 5.0
+
+# Control messages that share the queue with stat records
+_FLUSH = object()
+_QUERY = object()
+_STOP = object()
+
+
+# Stat records are put into a queue by the game thread and written by a
+# background thread in batched transactions, so the game thread never
+# touches the database. Once tm_stats_queue_size records are waiting, new
+# ones are dropped and counted; control messages are never dropped and never
+# wait, the queue itself is unbounded. Query results are handed back
+# through a deque that is polled on every tick, and their callbacks run on
+# the game thread.
+class StatsStore:
+    def __init__(self, path):
+        self.path = path
+        self.dropped = 0
+        self.written = 0
+
+        self._queue = None
+        self._queue_size = 0
+        self._thread = None
+        self._results = deque()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._queue = Queue()
+        self._queue_size = config.stats_queue_size
+        self._thread = Thread(
+            target=self._run, name="tripmines-stats", daemon=True)
+
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+
+        self._put_control(_STOP, None)
+        self._thread.join(STOP_TIMEOUT)
+        self._thread = None
+        self._queue = None
+
+    def add(self, player, column, amount=1):
+        if not config.stats_enable:
+            return
+
+        # Read from the entity, so that name changes are picked up
+        entity = player.player
+        steamid = entity.steamid
+        if steamid == 'BOT':
+            return
+
+        if self._thread is None:
+            self.start()
+
+        # Only the game thread puts, so the writer can only make the real
+        # size smaller than this
+        if self._queue.qsize() >= self._queue_size:
+            self.dropped += 1
+            return
+
+        self._queue.put_nowait((steamid, entity.name, column, amount))
+
+    def record(self, index, column, amount=1):
+        # The player might have already disconnected
+        player = player_manager.by_index[index]
+        if player is not None:
+            self.add(player, column, amount)
+
+    def _put_control(self, message, payload):
+        # Never blocks, this is called on the game thread (tm_top, level
+        # shutdown)
+        self._queue.put_nowait((message, payload))
+
+    def flush(self):
+        if self._thread is not None:
+            self._put_control(_FLUSH, None)
+
+    def query_top(self, column, count, callback):
+        if column not in STATS_COLUMNS:
+            raise ValueError("Unknown stats column '{}'".format(column))
+
+        if self._thread is None:
+            self.start()
+
+        self._put_control(_QUERY, (column, count, callback))
+
+    def poll_results(self):
+        while self._results:
+            callback, rows = self._results.popleft()
+            try:
+                callback(rows)
+            except Exception:
+                echo_console(format_exc())
+
+    def _run(self):
+        # Only imported once stats are actually recorded
+        import sqlite3
+
+        connection = sqlite3.connect(str(self.path))
+        try:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS players ("
+                "steamid TEXT PRIMARY KEY, name TEXT, " +
+                ", ".join(
+                    "{} INTEGER NOT NULL DEFAULT 0".format(column)
+                    for column in STATS_COLUMNS) +
+                ")"
+            )
+            connection.commit()
+
+            self._serve(connection)
+        except Exception:
+            echo_console(format_exc())
+        finally:
+            connection.close()
+
+    def _serve(self, connection):
+        pending = {}
+        pending_records = 0
+
+        # Pending records are written by this time at the latest, however
+        # steadily new ones keep coming
+        deadline = None
+        while True:
+            if deadline is None:
+                timeout = None
+            else:
+                timeout = max(0.0, deadline - monotonic())
+
+            try:
+                item = self._queue.get(timeout=timeout)
+            except Empty:
+                item = (_FLUSH, None)
+
+            message, payload = item[0], item[1]
+            if message is _FLUSH or message is _STOP:
+                self._write(connection, pending)
+                pending_records = 0
+                deadline = None
+                if message is _STOP:
+                    return
+
+                continue
+
+            if message is _QUERY:
+                self._write(connection, pending)
+                pending_records = 0
+                deadline = None
+
+                column, count, callback = payload
+                rows = connection.execute(
+                    "SELECT name, {0} FROM players WHERE {0} > 0 "
+                    "ORDER BY {0} DESC LIMIT ?".format(column),
+                    (count, )
+                ).fetchall()
+
+                self._results.append((callback, rows))
+                continue
+
+            steamid, name, column, amount = item
+            counters = pending.get(steamid)
+            if counters is None:
+                counters = pending[steamid] = dict.fromkeys(STATS_COLUMNS, 0)
+
+            counters['name'] = name
+            counters[column] += amount
+
+            if deadline is None:
+                deadline = monotonic() + config.stats_flush_interval
+
+            pending_records += 1
+            if pending_records >= config.stats_batch_size:
+                self._write(connection, pending)
+                pending_records = 0
+                deadline = None
+
+    def _write(self, connection, pending):
+        if not pending:
+            return
+
+        with connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO players (steamid) VALUES (?)",
+                ((steamid, ) for steamid in pending)
+            )
+            connection.executemany(
+                "UPDATE players SET name = ?, " + ", ".join(
+                    "{0} = {0} + ?".format(column)
+                    for column in STATS_COLUMNS) +
+                " WHERE steamid = ?",
+                ((counters['name'],
+                  *(counters[column] for column in STATS_COLUMNS),
+                  steamid) for steamid, counters in pending.items())
+            )
+
+        self.written += len(pending)
+        pending.clear()
+
+stats_store = StatsStore(STATS_DATABASE_PATH)
+
+
+@OnTick
+def listener_on_tick():
+    stats_store.poll_results()
+
+
+@OnLevelShutdown
+def listener_on_level_shutdown():
+    stats_store.flush()
+
+
+@InternalEvent('unload')
+def on_unload(event_var):
+    stats_store.stop()
+    stats_store.poll_results()
+
+
+@ServerCommand('tm_top')
+def server_tm_top(command):
+    column = command[1] if len(command) > 1 else 'kills'
+    if column not in STATS_COLUMNS:
+        echo_console("Usage: tm_top [{}] [count]".format(
+            "|".join(STATS_COLUMNS)))
+
+        return
+
+    try:
+        count = int(command[2]) if len(command) > 2 else 10
+    except ValueError:
+        count = 10
+
+    def print_rows(rows):
+        echo_console("TripMines top {} by {}:".format(count, column))
+        for position, (name, value) in enumerate(rows, start=1):
+            echo_console("{:>3}. {:<32} {:>8}".format(position, name, value))
+
+    # Rows are printed a few ticks later, once the writer has fetched them
+    stats_store.query_top(column, count, print_rows)
@@ -1,10 +1,15 @@
+from collections import OrderedDict
+
 from colors import Color
+from commands.server import ServerCommand
 
 from advanced_ts import BaseLangStrings
 
 from .info import info
 
 
+MESSAGE_CACHE_SIZE = 256
+
 # Map color variables in translation files to actual Color instances
 COLOR_SCHEME = {
     'color_tag': Color(242, 242, 242),
@@ -14,3 +19,63 @@ COLOR_SCHEME = {
 }
 
 strings = BaseLangStrings(info.basename)
+
+
+# Fully rendered chat strings (chat_base included) keyed by string name,
+# language and token values, least recently used ones are evicted first
+class MessageCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+
+        self._cache = OrderedDict()
+        self._names = {}
+
+        self.reset()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def reset(self):
+        self._cache.clear()
+        self._names = {id(value): key for key, value in strings.items()}
+
+    @staticmethod
+    def _render(message, language, tokens):
+        message = message.get_string(language, **dict(tokens, **COLOR_SCHEME))
+        return strings['chat_base'].get_string(
+            language, message=message, **COLOR_SCHEME)
+
+    def render(self, message, language, tokens):
+        # Only base strings are cached, tokenized copies are short-lived
+        name = self._names.get(id(message))
+        if name is None:
+            return self._render(message, language, tokens)
+
+        try:
+            key = (name, language, frozenset(tokens.items()))
+            rendered = self._cache[key]
+        except TypeError:
+            return self._render(message, language, tokens)
+        except KeyError:
+            rendered = self._cache[key] = self._render(
+                message, language, tokens)
+
+            if len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+
+        return rendered
+
+message_cache = MessageCache(MESSAGE_CACHE_SIZE)
+
+
+def reload_strings():
+    strings.clear()
+    strings.update(BaseLangStrings(info.basename))
+    message_cache.reset()
+
+
+@ServerCommand('tm_reload_translations')
+def server_tm_reload_translations(command):
+    reload_strings()
@@ -0,0 +1,100 @@
+from heapq import heappop, heappush
+from traceback import format_exc
+
+from core import echo_console
+from engines.server import global_vars
+from listeners import OnLevelShutdown, OnTick
+
+
+# Every key (a TripMine) has at most one pending timer, so memory per mine
+# stays constant no matter how long it lives. Timers due in the same tick
+# share one bucket and are fired in a single pass.
+class TimerWheel:
+    def __init__(self):
+        self._buckets = {}
+        self._deadlines = {}
+        self._bucket_ticks = []
+
+        # Called after every tick that fired any timers
+        self.batch_callbacks = []
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def schedule(self, key, delay, callback):
+        self.cancel(key)
+
+        tick = global_vars.tick_count + max(
+            1, round(delay / global_vars.interval_per_tick))
+
+        bucket = self._buckets.get(tick)
+        if bucket is None:
+            bucket = self._buckets[tick] = {}
+            heappush(self._bucket_ticks, tick)
+
+        bucket[key] = callback
+        self._deadlines[key] = tick
+
+    def cancel(self, key):
+        tick = self._deadlines.pop(key, None)
+        if tick is None:
+            return
+
+        bucket = self._buckets[tick]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[tick]
+
+    def clear(self):
+        self._buckets.clear()
+        self._deadlines.clear()
+        self._bucket_ticks.clear()
+
+    def tick(self):
+        if not self._deadlines:
+            self._bucket_ticks.clear()
+            return
+
+        now = global_vars.tick_count
+        bucket_ticks = self._bucket_ticks
+        if not bucket_ticks or bucket_ticks[0] > now:
+            return
+
+        while bucket_ticks and bucket_ticks[0] <= now:
+            tick = heappop(bucket_ticks)
+            bucket = self._buckets.get(tick)
+            if bucket is None:
+                continue
+
+            # Callbacks may cancel other timers from the same bucket
+            while bucket:
+                key, callback = bucket.popitem()
+                del self._deadlines[key]
+
+                try:
+                    callback()
+                except Exception:
+                    echo_console(format_exc())
+
+            self._buckets.pop(tick, None)
+
+        for callback in self.batch_callbacks:
+            try:
+                callback()
+            except Exception:
+                echo_console(format_exc())
+
+timer_wheel = TimerWheel()
+
+
+@OnTick
+def listener_on_tick():
+    timer_wheel.tick()
+
+
+@OnLevelShutdown
+def listener_on_level_shutdown():
+    timer_wheel.clear()
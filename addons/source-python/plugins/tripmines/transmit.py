@@ -0,0 +1,219 @@
+from entities.transmit import transmit_manager
+
+from .cvars import config
+from .spatial import segment_intersects_box
+from .trip_mine_player import player_manager
+
+
+class Viewer:
+    __slots__ = ('x', 'y', 'z', 'team', 'allowed')
+
+    def __init__(self, x, y, z, team):
+        self.x = x
+        self.y = y
+        self.z = z
+        self.team = team
+        self.allowed = set()
+
+
+# Decides which clients get mine entities networked to them. Every player
+# keeps a set of mines they're allowed to see, built from spatial queries
+# around them; it's only rebuilt when they move further than
+# transmit_move_threshold or change team, and is patched one mine at a time
+# when mines appear, activate or go away. Only the differences are pushed to
+# the transmit manager, so transmit passes themselves cost us nothing.
+class TransmitCuller:
+    def __init__(self, spatial):
+        self.spatial = spatial
+
+        self._viewers = {}
+        self._settings = None
+
+    def __len__(self):
+        return len(self._viewers)
+
+    def _get_radii(self):
+        radius = config.transmit_radius
+        enemy_radius = config.transmit_enemy_radius
+        if enemy_radius <= 0:
+            enemy_radius = radius
+
+        # Until the next rebuild the viewer might come this much closer to
+        # any mine, so rebuilt sets reach that much further
+        margin = config.transmit_move_threshold
+        return radius + margin, enemy_radius + margin
+
+    def _is_visible(self, trip_mine, viewer, radius):
+        x, y, z = self.spatial.get_point(trip_mine)
+        dx = x - viewer.x
+        dy = y - viewer.y
+        dz = z - viewer.z
+        if dx * dx + dy * dy + dz * dz <= radius * radius:
+            return True
+
+        # Beams are long, being close to any part of them is enough
+        if trip_mine.beam_end is None:
+            return False
+
+        start, end = self.spatial.get_segment(trip_mine)
+        return segment_intersects_box(
+            start, end,
+            (viewer.x - radius, viewer.y - radius, viewer.z - radius),
+            (viewer.x + radius, viewer.y + radius, viewer.z + radius)
+        )
+
+    def _query(self, viewer):
+        radius, enemy_radius = self._get_radii()
+        max_radius = max(radius, enemy_radius)
+
+        candidates = set(self.spatial.iter_within_radius(
+            (viewer.x, viewer.y, viewer.z), max_radius))
+        candidates.update(self.spatial.query_box(
+            (viewer.x - max_radius,
+             viewer.y - max_radius,
+             viewer.z - max_radius),
+            (viewer.x + max_radius,
+             viewer.y + max_radius,
+             viewer.z + max_radius)
+        ))
+
+        if radius == enemy_radius:
+            return candidates
+
+        allowed = set()
+        for trip_mine in candidates:
+            if trip_mine.owner.team == viewer.team:
+                mine_radius = radius
+            else:
+                mine_radius = enemy_radius
+
+            if self._is_visible(trip_mine, viewer, mine_radius):
+                allowed.add(trip_mine)
+
+        return allowed
+
+    @staticmethod
+    def _hide(trip_mine, index):
+        if trip_mine.entities is not None:
+            for entity_index in trip_mine.entities.indexes:
+                transmit_manager.hide_from(entity_index, index)
+
+    @staticmethod
+    def _show(trip_mine, index):
+        if trip_mine.entities is not None:
+            for entity_index in trip_mine.entities.indexes:
+                transmit_manager.reset_from(entity_index, index)
+
+    def _rebuild(self, index, viewer, first_time):
+        allowed = self._query(viewer)
+
+        if first_time:
+            # Everything is transmitted to a new viewer by default
+            for trip_mine in self.spatial.iter_point_keys():
+                if trip_mine not in allowed:
+                    self._hide(trip_mine, index)
+        else:
+            for trip_mine in viewer.allowed - allowed:
+                self._hide(trip_mine, index)
+
+            for trip_mine in allowed - viewer.allowed:
+                self._show(trip_mine, index)
+
+        viewer.allowed = allowed
+
+    def update(self):
+        settings = (
+            config.transmit_culling,
+            config.transmit_radius,
+            config.transmit_enemy_radius,
+            config.transmit_move_threshold,
+        )
+        if settings != self._settings:
+            self.reset()
+            self._settings = settings
+
+        if not config.transmit_culling:
+            return
+
+        threshold_sqr = config.transmit_move_threshold ** 2
+        for player in player_manager.values():
+            index = player.index
+            entity = player.player
+            origin = entity.origin
+            team = entity.team
+
+            viewer = self._viewers.get(index)
+            if viewer is None:
+                viewer = self._viewers[index] = Viewer(
+                    origin.x, origin.y, origin.z, team)
+
+                self._rebuild(index, viewer, True)
+                continue
+
+            dx = origin.x - viewer.x
+            dy = origin.y - viewer.y
+            dz = origin.z - viewer.z
+            if (team == viewer.team and
+                    dx * dx + dy * dy + dz * dz < threshold_sqr):
+
+                continue
+
+            viewer.x, viewer.y, viewer.z = origin.x, origin.y, origin.z
+            viewer.team = team
+            self._rebuild(index, viewer, False)
+
+    def update_mine(self, trip_mine):
+        # The mine got its entities or its beam, re-check it for every viewer
+        if not self._viewers:
+            return
+
+        radius, enemy_radius = self._get_radii()
+        for index, viewer in self._viewers.items():
+            if trip_mine.owner.team == viewer.team:
+                mine_radius = radius
+            else:
+                mine_radius = enemy_radius
+
+            if self._is_visible(trip_mine, viewer, mine_radius):
+                if trip_mine not in viewer.allowed:
+                    viewer.allowed.add(trip_mine)
+                    self._show(trip_mine, index)
+            else:
+                viewer.allowed.discard(trip_mine)
+                self._hide(trip_mine, index)
+
+    def remove_mine(self, trip_mine):
+        if not self._viewers:
+            return
+
+        for viewer in self._viewers.values():
+            viewer.allowed.discard(trip_mine)
+
+        # Entities go back to the pool visible to everybody
+        if trip_mine.entities is not None:
+            for entity_index in trip_mine.entities.indexes:
+                transmit_manager.reset(entity_index)
+
+    def remove_viewer(self, index):
+        if self._viewers.pop(index, None) is None:
+            return
+
+        # Don't let the next client with this index inherit hidden mines
+        for trip_mine in self.spatial.iter_point_keys():
+            self._show(trip_mine, index)
+
+    def reset(self):
+        if not self._viewers:
+            return
+
+        for trip_mine in self.spatial.iter_point_keys():
+            if trip_mine.entities is not None:
+                for entity_index in trip_mine.entities.indexes:
+                    transmit_manager.reset(entity_index)
+
+        self._viewers.clear()
+
+    def forget(self):
+        # Entities are already gone along with their transmit states, and
+        # their indexes may belong to somebody else by now
+        self._viewers.clear()
@@ -1,3 +1,6 @@
+from array import array
+
+from engines.server import global_vars
 from events import Event
 from filters.players import PlayerIter
 from listeners import OnClientActive, OnClientDisconnect, OnLevelShutdown
@@ -6,29 +9,137 @@ from players.entity import Player
 from players.helpers import index_from_userid
 from players.teams import teams_by_name
 
+from .cvars import config
 from .internal_events import InternalEvent
-from .strings import COLOR_SCHEME, strings
+from .strings import message_cache
 
 
+# Only what is read on most plant attempts is kept here; per-round and
+# rate limiting counters live in per-index arrays of TripMinePlayerManager
 class TripMinePlayer:
+    __slots__ = ('player', 'index', 'language', 'mines', 'last_mine_time')
+
     def __init__(self, player):
         self.player = player
+        self.index = player.index
+        self.language = player.language
         self.mines = 0
         self.last_mine_time = 0
-        self.total_mines_planted = 0
 
     def __eq__(self, other):
-        return self.player.index == other.player.index
+        return self.index == other.index
 
 
+# Players are also kept in a list preallocated to maxplayers and addressed
+# by player index, which is what per-tick hooks use. Counters are kept in
+# arrays of the same size, they are reset whenever a player takes an index.
 class TripMinePlayerManager(dict):
+    def __init__(self):
+        super().__init__()
+
+        size = global_vars.max_clients + 1
+        self.by_index = [None] * size
+
+        # Mines planted this round and still alive. A list rather than an
+        # array: it is updated on every plant and destroy, and every array
+        # item access creates a new int object
+        self.mines_planted = [0] * size
+
+        # Token buckets of plant attempts and the last denial told
+        self._attempt_tokens = array('d', [0.0]) * size
+        self._attempt_times = array('d', [0.0]) * size
+        self.dropped_attempts = array('L', [0]) * size
+        self._last_denials = [None] * size
+        self._last_denial_times = array('d', [0.0]) * size
+        self.dropped_denials = array('L', [0]) * size
+
+    def _set_by_index(self, index, player):
+        missing = index + 1 - len(self.by_index)
+        if missing > 0:
+            self.by_index.extend([None] * missing)
+            self._last_denials.extend([None] * missing)
+            self.mines_planted.extend([0] * missing)
+            for counters in (
+                    self._attempt_tokens,
+                    self._attempt_times, self.dropped_attempts,
+                    self._last_denial_times, self.dropped_denials):
+
+                counters.extend([0] * missing)
+
+        self.by_index[index] = player
+
+        self.mines_planted[index] = 0
+        self._attempt_tokens[index] = config.attempt_burst
+        self._attempt_times[index] = 0.0
+        self.dropped_attempts[index] = 0
+        self._last_denials[index] = None
+        self._last_denial_times[index] = 0.0
+        self.dropped_denials[index] = 0
+
     def __setitem__(self, key, value):
         dict.__setitem__(self, key, value)
+        self._set_by_index(key, value)
         InternalEvent.fire('player_registered', player=value)
 
     def __delitem__(self, key):
         InternalEvent.fire('player_unregistered', player=self[key])
         dict.__delitem__(self, key)
+        self.by_index[key] = None
+
+    def register_many(self, players):
+        players = tuple(players)
+        for player in players:
+            dict.__setitem__(self, player.index, player)
+            self._set_by_index(player.index, player)
+
+        InternalEvent.fire_many(
+            'player_registered', [{'player': player} for player in players])
+
+    def unregister_all(self):
+        players = tuple(self.values())
+        InternalEvent.fire_many(
+            'player_unregistered', [{'player': player} for player in players])
+
+        dict.clear(self)
+        self.by_index[:] = [None] * len(self.by_index)
+
+    def reset_round_counters(self):
+        # One bulk fill instead of a walk over every player
+        self.mines_planted[:] = [0] * len(self.mines_planted)
+
+    def take_attempt_token(self, index, now):
+        # Token bucket refilled at attempt_rate tokens per second, holding
+        # up to attempt_burst of them; every plant attempt takes one
+        rate = config.attempt_rate
+        if rate <= 0:
+            return True
+
+        tokens = min(
+            config.attempt_burst,
+            self._attempt_tokens[index] +
+            (now - self._attempt_times[index]) * rate)
+
+        self._attempt_times[index] = now
+        if tokens < 1:
+            self._attempt_tokens[index] = tokens
+            self.dropped_attempts[index] += 1
+            return False
+
+        self._attempt_tokens[index] = tokens - 1
+        return True
+
+    def should_tell_denial(self, index, message, now):
+        # The same denial is only told once per denial_message_window
+        if (message is self._last_denials[index] and
+                now - self._last_denial_times[index] <
+                config.denial_message_window):
+
+            self.dropped_denials[index] += 1
+            return False
+
+        self._last_denials[index] = message
+        self._last_denial_times[index] = now
+        return True
 
     def get_by_userid(self, userid):
         return self[index_from_userid(userid)]
@@ -48,25 +159,25 @@ def listener_on_client_disconnect(index):
 
 @OnLevelShutdown
 def listener_on_level_shutdown():
-    for index in tuple(player_manager.keys()):
-        del player_manager[index]
+    player_manager.unregister_all()
 
 
 @InternalEvent('load')
 def on_load(event_var):
-    for player in PlayerIter():
-        player_manager[player.index] = TripMinePlayer(player)
+    player_manager.register_many(
+        TripMinePlayer(player) for player in PlayerIter())
 
 
 @InternalEvent('unload')
 def on_unload(event_var):
-    for index in tuple(player_manager.keys()):
-        del player_manager[index]
+    player_manager.unregister_all()
 
 
 @Event('player_spawn')
 def on_player_spawn(game_event):
     player = player_manager.get_by_userid(game_event['userid'])
+    player.language = player.player.language
+
     if player.player.team != teams_by_name['un']:
         InternalEvent.fire(
             'player_respawn',
@@ -79,14 +190,16 @@ def tell(players, message, **tokens):
     if isinstance(players, TripMinePlayer):
         players = (players, )
 
-    player_indexes = [player.player.index for player in players]
-
-    tokens.update(COLOR_SCHEME)
-
-    message = message.tokenize(**tokens)
-    message = strings['chat_base'].tokenize(message=message, **COLOR_SCHEME)
+    # One SayText2 per language, rendered strings come from the cache
+    indexes_by_language = {}
+    for player in players:
+        indexes_by_language.setdefault(
+            player.language, []).append(player.player.index)
 
-    SayText2(message=message).send(*player_indexes)
+    for language, player_indexes in indexes_by_language.items():
+        SayText2(
+            message=message_cache.render(message, language, tokens)
+        ).send(*player_indexes)
 
 
 def broadcast(message, **tokens):
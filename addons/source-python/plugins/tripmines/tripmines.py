@@ -1,9 +1,15 @@
-from math import asin, atan2, degrees, floor
+from math import asin, atan2, degrees
+from os import makedirs
 from random import choice
-from time import time
+from time import perf_counter, strftime, time
+
+# Plugin import time is measured from here
+_import_start_time = perf_counter()
 
 from colors import Color
 from commands.client import ClientCommand
+from commands.server import ServerCommand
+from core import echo_console
 from effects import temp_entities
 from engines.sound import Attenuation, Sound, SOUND_FROM_WORLD
 from engines.trace import (
@@ -11,13 +17,16 @@ from engines.trace import (
     TraceFilterSimple)
 
 from engines.precache import Model
+from engines.server import global_vars, queue_command_string
 from entities import TakeDamageInfo
-from entities.constants import WORLD_ENTITY_INDEX
 from entities.entity import Entity
+from entities.helpers import index_from_pointer
 from entities.hooks import EntityCondition, EntityPreHook
 from events import Event
 from filters.recipients import RecipientFilter
-from listeners import OnClientDisconnect, OnEntityOutput
+from listeners import (
+    on_entity_output_listener_manager, OnClientDisconnect, OnLevelInit,
+    OnLevelShutdown, OnTick)
 from listeners.tick import Delay
 from memory import make_object
 from paths import PLUGIN_DATA_PATH
@@ -31,15 +40,33 @@ from stringtables.downloads import Downloadables
 from mathlib import NULL_VECTOR, Vector
 
 from .info import info
-from .cvars import config_manager
+from .beam_collision import BeamCollisionEngine
+from .chain_reaction import NeighbourGraph
+from .cvars import config
+from .entity_pool import (
+    entity_pool, TOUCH_TYPE_NONE, TOUCH_TYPE_PLAYERS_OR_NPCS)
 from .internal_events import InternalEvent
+from .journal import (
+    EVENT_ACTIVATE, EVENT_BEEP, EVENT_DESTROY, EVENT_DETONATE, EVENT_PLANT,
+    EVENT_SHOT_DOWN, EVENT_SPLASH_HIT, EVENT_TRIP, journal)
+from .metrics import metrics
+from .player_snapshot import player_snapshot
+from .profiler import profiler
+from .reload_state import pop_reload_state, save_reload_state
+from .recipients import BeepBatch, get_recipients, play_sound
+from .spatial import SpatialHash
+from .splash import splash_engine
+from .stats import stats_store
 from .strings import strings
 from .take_damage import take_damage
+from .timer_wheel import timer_wheel
+from .transmit import TransmitCuller
 from .trip_mine_player import broadcast, player_manager, tell
+from .work_queue import work_queue
 
 
-PROP_MODEL = Model('models/weapons/w_slam.mdl')
-BEAM_MODEL = Model('sprites/laserbeam.vmt')
+CT_BEAM_COLOR = Color(100, 100, 255)
+T_BEAM_COLOR = Color(255, 100, 100)
 EXPLOSION_MODEL = Model('sprites/zerogxplode.spr')
 EXPLOSION_SOUNDS = [
     'weapons/explode3.wav',
@@ -48,16 +75,36 @@ EXPLOSION_SOUNDS = [
 ]
 PLANT_OFFSET = 1.5
 PLANT_ANGLES = Vector(90, 0, 0)
+PLANT_BUTTONS = int(PlayerButtons.SCORE | PlayerButtons.USE)
+SPATIAL_CELL_SIZE = 128.0
+BEEP_MERGE_CELL_SIZE = 256.0
+STATS_ROW_FORMAT = "{:<14} {:>9} {:>11.3f} {:>9.1f} {:>9.1f} {:>9.1f}"
+STATS_TOP_DROPPERS = 5
+
+# Metric names of denial reasons, built once so that counting a denial
+# doesn't format any strings
+DENIAL_METRIC_NAMES = {
+    reason: 'denials.' + reason.split(' ', 1)[1]
+    for reason in (
+        'fail disabled', 'fail too_soon', 'fail dead', 'fail wrong_team',
+        'fail no_mines', 'fail too_many', 'fail too_far', 'fail too_close',
+    )
+}
+JOURNAL_PATH = PLUGIN_DATA_PATH / info.basename / "journal"
 
 
 _announcement_delay = None
+
+# Indexes of players who are currently holding TAB+E
+_plant_buttons_held = set()
+
+# Set by tm_reload so that unload() keeps the mines for the next instance
+_reloading = False
+
+# Plugin import and load() times (in seconds)
+_load_timings = [0.0, 0.0]
+
 _downloadables = Downloadables()
-with open(PLUGIN_DATA_PATH / info.basename / "downloadlist.res") as f:
-    for line in f:
-        line = line.strip()
-        if not line:
-            continue
-        _downloadables.add(line)
 
 
 class TripMine:
@@ -68,74 +115,114 @@ class TripMine:
         self.normal = normal
 
         self.activated = False
+        self.destroyed = False
 
         self.prop = None
         self.beam = None
         self.beam_target = None
+        self.beam_end = None
+        self.entities = None
 
-        self._delays = []
-
-        self.create()
+    def log(self, event, other_index=0, damage=0):
+        if not journal.is_open:
+            return
 
-    def __del__(self):
-        self.cancel_delays()
+        journal.write(
+            time(), global_vars.tick_count, event, self.id,
+            self.owner.index, other_index, damage,
+            self.origin.x, self.origin.y, self.origin.z
+        )
 
-    def cancel_delays(self):
-        for delay in self._delays:
-            if delay.running:
-                delay.cancel()
+    def cancel_timers(self):
+        timer_wheel.cancel(self)
 
-        self._delays.clear()
+    def _activate(self):
+        timer_wheel.schedule(self, config.beep_interval, self._beep)
+        self.create_beam()
 
     def _beep(self):
         if self.prop is None:
             return
 
-        if config_manager['beep_sound'] != "":
-            Sound(config_manager['beep_sound'],
-                  index=self.prop.index,
-                  attenuation=Attenuation.STATIC).play()
+        if config.beep_sound_enabled:
+            # Played by flush_beeps() once all timers of this tick are done
+            beep_batch.add(self)
+            self.log(EVENT_BEEP)
 
-            self._delays.append(
-                Delay(config_manager['beep_interval'], self._beep))
+            timer_wheel.schedule(
+                self, config.beep_interval, self._beep)
 
     def create(self):
+        # Until the queued spawn runs, the mine has no entities and
+        # stays inactive
+        work_queue.add(self._spawn)
+        self.log(EVENT_PLANT)
+
+    def _spawn(self):
+        if self.destroyed:
+            return
+
         self.create_prop()
-        self._delays.append(
-            Delay(config_manager['activation_delay'], self.create_beam))
-
-        self._delays.append(
-            Delay(
-                config_manager['activation_delay'] +
-                config_manager['beep_interval'],
-                self._beep
+        trip_mine_manager.register_prop(self)
+        timer_wheel.schedule(
+            self, config.activation_delay, self._activate)
+
+    def attach(self, entities, beam_end, traced):
+        # Take over entities of a mine from before the plugin reload
+        self.entities = entities
+        self.prop = entities.prop
+        trip_mine_manager.register_prop(self)
+
+        if beam_end is None:
+            timer_wheel.schedule(
+                self, config.activation_delay, self._activate)
+
+            return
+
+        entities.touch_type = (
+            TOUCH_TYPE_NONE if traced else TOUCH_TYPE_PLAYERS_OR_NPCS)
+
+        self.beam_end = Vector(*beam_end)
+        self.beam_target = entities.beam_target
+        self.beam = entities.beam
+        trip_mine_manager.register_beam(self, traced)
+
+        self.activated = True
+        timer_wheel.schedule(self, config.beep_interval, self._beep)
+
+    def to_record(self):
+        return [
+            self.entities.slot,
+            self.id,
+            self.owner.userid,
+            vector_to_tuple(self.origin),
+            vector_to_tuple(self.normal),
+            vector_to_tuple(self.beam_end) if self.activated else None,
+            self in trip_mine_manager.beam_collision,
+        ]
+
+    def create_prop(self):
+        self.entities = entity_pool.acquire()
+        self.prop = self.entities.prop
+        self.entities.show_prop(
+            self.origin + self.normal * PLANT_OFFSET,
+            PLANT_ANGLES + Vector(
+                -degrees(asin(self.normal.z)),
+                degrees(atan2(self.normal.y, self.normal.x)),
+                0,
             )
         )
 
-    def create_prop(self):
-        origin = self.origin + self.normal * PLANT_OFFSET
-        self.prop = Entity.create("prop_physics_override")
-        self.prop.target_name = "_tripmines_prop_{}".format(self.id)
-        self.prop.model = PROP_MODEL
-        self.prop.spawn_flags = 8
-        self.prop.teleport(origin, PLANT_ANGLES + Vector(
-            -degrees(asin(self.normal.z)),
-            degrees(atan2(self.normal.y, self.normal.x)),
-            0,
-        ), None)
-
-        # Make it non-solid so that the beam goes through
-        self.prop.solid_type = 6
-        self.prop.collision_group = 11
-
-        self.prop.spawn()
-
-        if config_manager['plant_sound'] != "":
-            Sound(
-                config_manager['plant_sound'],
-                index=self.prop.index,
-                attenuation=Attenuation.STATIC).play()
+        if config.plant_sound_enabled:
+            play_sound(
+                Sound(config.plant_sound,
+                      index=self.prop.index,
+                      attenuation=Attenuation.STATIC),
+                self.origin,
+                config.plant_sound_radius
+            )
 
+    @profiler.profiled('create_beam')
     def create_beam(self):
         if self.prop is None:
             raise RuntimeError("Create prop first")
@@ -153,92 +240,73 @@ class TripMine:
         if not trace.did_hit():
             return
 
+        self.beam_end = trace.end_position
+
         if self.owner.team == teams_by_name['ct']:
-            beam_color = Color(100, 100, 255)
+            beam_color = CT_BEAM_COLOR
         else:
-            beam_color = Color(255, 100, 100)
-
-        self.beam_target = Entity.create("env_spark")
-        self.beam_target.target_name = "_tripmines_target1_{}".format(self.id)
-        self.beam_target.teleport(self.origin, None, None)
-        self.beam_target.spawn()
-
-        self.beam = Entity.create("env_beam")
-        self.beam.target_name = "_tripmines_beam_{}".format(self.id)
-        self.beam.spawn_flags = 1
-        self.beam.teleport(trace.end_position, None, None)
-
-        self.beam.set_key_value_float('BoltWidth', 1.0)
-        self.beam.set_key_value_int('damage', 0)
-        self.beam.set_key_value_float('HDRColorScale', 1.0)
-        self.beam.set_key_value_int('life', 0)
-        self.beam.set_key_value_string(
-            'LightningStart', self.beam.target_name)
-        self.beam.set_key_value_string(
-            'LightningEnd', self.beam_target.target_name)
-        self.beam.set_key_value_int('Radius', 255)
-        self.beam.set_key_value_int('renderamt', 100)
-        self.beam.set_key_value_color('rendercolor', beam_color)
-        self.beam.set_key_value_int('StrikeTime', 1)
-        self.beam.set_key_value_string('texture', "sprites/laserbeam.spr")
-        self.beam.set_key_value_int('TextureScroll', 35)
-        self.beam.set_key_value_int('TouchType', 3)
-
-        self.beam.model = BEAM_MODEL
-        self.beam.set_property_vector('m_vecEndPos', self.origin)
-
-        self.beam.spawn()
+            beam_color = T_BEAM_COLOR
+
+        self.beam_target = self.entities.beam_target
+        self.beam = self.entities.beam
+        self.entities.show_beam(
+            self.origin, trace.end_position, beam_color,
+            TOUCH_TYPE_NONE if config.trace_beams
+            else TOUCH_TYPE_PLAYERS_OR_NPCS
+        )
 
-        self.beam.call_input('TurnOff')
-        self.beam.call_input('TurnOn')
+        trip_mine_manager.register_beam(self, config.trace_beams)
 
         self.activated = True
+        self.log(EVENT_ACTIVATE)
+
+        if config.activation_sound_enabled:
+            play_sound(
+                Sound(config.activation_sound,
+                      index=self.prop.index,
+                      attenuation=Attenuation.STATIC),
+                self.origin,
+                config.activation_sound_radius
+            )
 
-        if config_manager['activation_sound'] != "":
-            Sound(config_manager['activation_sound'],
-                  index=self.prop.index,
-                  attenuation=Attenuation.STATIC).play()
-
-    def _hurt_around(self, ignore=()):
-        for player in player_manager.values():
-            if player.player.index in ignore:
-                continue
-
-            if player.player.dead:
-                continue
+    @profiler.profiled('hurt_around')
+    def _hurt_around(self, ignore=(), chained_trip_mines=()):
+        trip_mines = [self]
+        explosions = [(self.origin, self.owner, ignore)]
+        for trip_mine in chained_trip_mines:
+            trip_mines.append(trip_mine)
+            explosions.append((trip_mine.origin, trip_mine.owner, ()))
 
-            if player.player.team not in (
-                    teams_by_name['t'], teams_by_name['ct']):
+        hits = splash_engine.hurt(explosions)
+        metrics.increment('splash_victims', len(hits))
 
+        for owner, victim, damage, killed, number in hits:
+            trip_mines[number].log(EVENT_SPLASH_HIT, victim.index, damage)
+            if victim.index == owner.index:
                 continue
 
-            if (not config_manager['allow_teamkill'] and
-                    self.owner != player.player and
-                    self.owner.team == player.player.team):
+            stats_store.record(owner.index, 'damage', damage)
+            if killed:
+                stats_store.record(owner.index, 'kills')
 
-                continue
-
-            distance = (self.origin - player.player.origin).length
-            damage = max(0, floor(
-                config_manager['damage_base'] -
-                distance * config_manager['damage_falloff_multiplier']
-            ))
+    def _detonate(self, entity):
+        self.activated = False
+        self.log(EVENT_DETONATE, entity.index)
 
-            if not damage:
-                continue
+        recipients = get_recipients(
+            self.origin, config.explosion_effect_radius)
 
-            take_damage(
-                player.player,
-                damage,
-                attacker=self.owner,
-            )
+        # None means everybody, an empty list - nobody is close enough
+        if recipients is None:
+            recipients = ()
+        elif not recipients:
+            return
 
-    def _detonate(self, entity):
-        self.activated = False
+        recipient_filter = RecipientFilter(*recipients)
 
         # Explosion visual effects
         temp_entities.explosion(
-            RecipientFilter(),      # Recipients
+            recipient_filter,       # Recipients
             0.0,                    # Delay
             self.prop.origin,       # Origin
             EXPLOSION_MODEL.index,  # Model index
@@ -256,21 +324,31 @@ class TripMine:
               index=SOUND_FROM_WORLD,
               attenuation=Attenuation.NORMAL,
               origin=self.prop.origin,
-              direction=self.normal).play()
+              direction=self.normal).play(*recipients)
 
     def destroy(self):
-        player_manager[self.owner.index].total_mines_planted -= 1
+        # The owner may have already been unregistered (disconnect)
+        owner = player_manager.get(self.owner.index)
+        if owner is not None:
+            player_manager.mines_planted[owner.index] -= 1
+
+        trip_mine_manager.remove(self)
+        self.destroyed = True
+        self.log(EVENT_DESTROY)
 
-        # Remove child entities
-        for child_entity in (self.prop, self.beam, self.beam_target):
-            child_entity.remove()
+        # Give child entities back to the pool
+        if self.entities is not None:
+            if self.beam is not None:
+                self.beam.call_input('TurnOff')
 
+            work_queue.add(entity_pool.release, self.entities)
+
+        self.entities = None
         self.prop = None
         self.beam = None
         self.beam_target = None
 
-        self.cancel_delays()
-        trip_mine_manager.remove(self)
+        self.cancel_timers()
 
     def on_touched_by_entity(self, entity):
         # Without turning the beam off and on again,
@@ -281,7 +359,7 @@ class TripMine:
         entity_receives_damage = True
         if entity.classname == 'player':
             entity = Player(entity.index)
-            if (not config_manager['allow_teamkill'] and
+            if (not config.allow_teamkill and
                     entity != self.owner and
                     entity.team == self.owner.team):
 
@@ -289,87 +367,411 @@ class TripMine:
 
             entity_receives_damage = not entity.dead
 
-        self._detonate(entity)
-        self.destroy()
+        self.log(EVENT_TRIP, entity.index)
+        chained_trip_mines = trip_mine_manager.detonate(self, entity)
+        stats_store.record(self.owner.index, 'triggered')
 
         if entity_receives_damage:
             take_damage(entity,
-                        config_manager['damage_base'],
+                        config.damage_base,
                         attacker=self.owner)
 
-        self._hurt_around(ignore=(entity.index, ))
+            if entity.classname == 'player':
+                # The splash below must not hurt the victim twice
+                player_snapshot.invalidate()
+
+                if entity.index != self.owner.index:
+                    stats_store.record(
+                        self.owner.index, 'damage', config.damage_base)
+                    if entity.dead:
+                        stats_store.record(self.owner.index, 'kills')
+
+        self._hurt_around((entity.index, ), chained_trip_mines)
 
     def on_prop_damaged(self, player):
-        if (not config_manager['allow_teamkill'] and
+        if (not config.allow_teamkill and
                 player != self.owner and
                 player.team == self.owner.team):
 
             return
 
-        self._detonate(player)
-        self.destroy()
-        self._hurt_around()
+        self.log(EVENT_SHOT_DOWN, player.index)
+        chained_trip_mines = trip_mine_manager.detonate(self, player)
+        if player != self.owner:
+            stats_store.record(player.index, 'destroyed')
+
+        self._hurt_around(chained_trip_mines=chained_trip_mines)
+
 
+def vector_to_tuple(vector):
+    return vector.x, vector.y, vector.z
 
-class TripMineManager(list):
+
+class TripMineManager(dict):
     def __init__(self):
         super().__init__()
 
         self._current_id = 0
+        self.by_beam_index = {}
+        self.by_touch_beam_index = {}
+        self._by_prop_index = {}
+        self.by_prop_address = {}
+        self._by_owner_index = {}
+        self.spatial = SpatialHash(SPATIAL_CELL_SIZE)
+        self.neighbour_graph = NeighbourGraph(self.spatial)
+        self.beam_collision = BeamCollisionEngine(SPATIAL_CELL_SIZE)
+        self.transmit_culler = TransmitCuller(self.spatial)
+
+    def _sync_neighbour_graph(self):
+        radius = config.chain_radius_effective
+        if radius != self.neighbour_graph.radius:
+            self.neighbour_graph.rebuild(radius)
 
     def create(self, owner, origin, normal):
-        self.append(TripMine(self._current_id, owner, origin, normal))
+        trip_mine = TripMine(self._current_id, owner, origin, normal)
         self._current_id += 1
 
-    def get_by_beam_index(self, index):
-        for trip_mine in self:
-            if trip_mine.beam is not None and trip_mine.beam.index == index:
-                return trip_mine
+        self._add(trip_mine)
+        trip_mine.create()
+
+        return trip_mine
+
+    def restore(self, record, owner, entities):
+        slot, id, userid, origin, normal, beam_end, traced = record
+
+        trip_mine = TripMine(id, owner, Vector(*origin), Vector(*normal))
+        self._current_id = max(self._current_id, id + 1)
+
+        self._add(trip_mine)
+        trip_mine.attach(entities, beam_end, traced)
+
+        return trip_mine
+
+    def _add(self, trip_mine):
+        owner = trip_mine.owner
+        origin = trip_mine.origin
+        self[trip_mine.id] = trip_mine
+        self._by_owner_index.setdefault(
+            owner.index, {})[trip_mine.id] = trip_mine
+
+        # A rebuild must not see the new mine yet, or it would be added to
+        # the graph twice and become its own neighbour
+        self._sync_neighbour_graph()
+        self.spatial.insert_point(trip_mine, vector_to_tuple(origin))
+        self.neighbour_graph.add(trip_mine)
+
+    def register_prop(self, trip_mine):
+        self._by_prop_index[trip_mine.prop.index] = trip_mine
+        self.by_prop_address[trip_mine.prop.pointer.address] = trip_mine
+        self.transmit_culler.update_mine(trip_mine)
+
+    def register_beam(self, trip_mine, traced):
+        self.by_beam_index[trip_mine.beam.index] = trip_mine
+        start = vector_to_tuple(trip_mine.origin)
+        end = vector_to_tuple(trip_mine.beam_end)
+        self.spatial.insert_segment(trip_mine, start, end)
+
+        if traced:
+            self.beam_collision.add(trip_mine, start, end)
+
+        else:
+            # Only listen to entity outputs while any of our beams can fire
+            # them, traced beams never do
+            if not self.by_touch_beam_index:
+                on_entity_output_listener_manager.register_listener(
+                    listener_on_entity_output)
+
+            self.by_touch_beam_index[trip_mine.beam.index] = trip_mine
+
+        self.transmit_culler.update_mine(trip_mine)
 
-        raise IndexError(
-            "Couldn't find appropriate tripmine to "
-            "beam index {}".format(index))
+    def remove(self, trip_mine):
+        del self[trip_mine.id]
+
+        if trip_mine.prop is not None:
+            self._by_prop_index.pop(trip_mine.prop.index, None)
+            self.by_prop_address.pop(trip_mine.prop.pointer.address, None)
+
+        if trip_mine.beam is not None:
+            del self.by_beam_index[trip_mine.beam.index]
+
+            if (self.by_touch_beam_index.pop(
+                    trip_mine.beam.index, None) is not None and
+                    not self.by_touch_beam_index):
+
+                on_entity_output_listener_manager.unregister_listener(
+                    listener_on_entity_output)
+
+        owned_trip_mines = self._by_owner_index[trip_mine.owner.index]
+        del owned_trip_mines[trip_mine.id]
+        if not owned_trip_mines:
+            del self._by_owner_index[trip_mine.owner.index]
+
+        self.transmit_culler.remove_mine(trip_mine)
+        self.neighbour_graph.remove(trip_mine)
+        self.spatial.remove(trip_mine)
+        self.beam_collision.remove(trip_mine)
+
+    def detonate(self, trip_mine, entity):
+        # Detonate and destroy the mine along with every active mine it sets
+        # off, return the latter so that their splash damage can be applied
+        # in one pass
+        self._sync_neighbour_graph()
+        chained_trip_mines = self.neighbour_graph.get_cascade(
+            trip_mine, lambda chained_trip_mine: chained_trip_mine.activated)
+
+        for detonated_trip_mine in (trip_mine, *chained_trip_mines):
+            detonated_trip_mine._detonate(entity)
+            detonated_trip_mine.destroy()
+
+        metrics.increment('detonations', len(chained_trip_mines) + 1)
+
+        return chained_trip_mines
+
+    def get_by_beam_index(self, index):
+        try:
+            return self.by_beam_index[index]
+        except KeyError:
+            raise IndexError(
+                "Couldn't find appropriate tripmine to "
+                "beam index {}".format(index)) from None
 
     def get_by_prop_index(self, index):
-        for trip_mine in self:
-            if trip_mine.prop is not None and trip_mine.prop.index == index:
-                return trip_mine
+        try:
+            return self._by_prop_index[index]
+        except KeyError:
+            raise IndexError(
+                "Couldn't find appropriate tripmine to "
+                "prop index {}".format(index)) from None
+
+    @profiler.profiled('beam_collision')
+    def check_beam_collisions(self):
+        # Beams activated in 'trace' detection mode don't fire touch
+        # outputs, players crossing them are found here instead
+        if not self.beam_collision:
+            return
+
+        snapshot = player_snapshot.refresh()
+        hits = self.beam_collision.collide(
+            snapshot.xs, snapshot.ys, snapshot.zs, snapshot.heights)
 
-        raise IndexError(
-            "Couldn't find appropriate tripmine to "
-            "prop index {}".format(index))
+        # Splash damage of a hit rebuilds the snapshot without the players
+        # it killed, so player numbers refer to this copy
+        players = tuple(snapshot.players)
+
+        for trip_mine, number in hits.items():
+            # Might have been set off by another mine in this very loop
+            if not trip_mine.activated:
+                continue
+
+            player = players[number].player
+            if player.dead:
+                continue
+
+            trip_mine.on_touched_by_entity(player)
+
+    def count_active_beams(self):
+        return len(self.by_beam_index)
 
     def iter_by_owner_index(self, index):
-        for trip_mine in self:
-            if trip_mine.owner.index == index:
-                yield trip_mine
+        yield from tuple(self._by_owner_index.get(index, {}).values())
+
+    def get_within_radius(self, origin, radius):
+        return self.spatial.query_radius(vector_to_tuple(origin), radius)
+
+    def get_by_beam_crossing_box(self, mins, maxs):
+        return self.spatial.query_box(
+            vector_to_tuple(mins), vector_to_tuple(maxs))
 
-    def reset(self):
-        for trip_mine in tuple(self):
-            trip_mine.cancel_delays()
+    def has_mines_within_radius(self, origin, radius):
+        return self.spatial.any_within_radius(vector_to_tuple(origin), radius)
 
-        self.clear()
+    def clear(self, entities_removed=False):
+        super().clear()
+
+        if entities_removed:
+            self.transmit_culler.forget()
+        else:
+            self.transmit_culler.reset()
+
+        self.neighbour_graph.clear()
+        self.spatial.clear()
+        self.beam_collision.clear()
+        if self.by_touch_beam_index:
+            on_entity_output_listener_manager.unregister_listener(
+                listener_on_entity_output)
+
+        self.by_beam_index.clear()
+        self.by_touch_beam_index.clear()
+        self._by_prop_index.clear()
+        self.by_prop_address.clear()
+        self._by_owner_index.clear()
+
+    @profiler.profiled('reset')
+    def reset(self, entities_removed=False):
+        timer_wheel.clear()
+
+        # Entities the queued jobs refer to are gone after round restart
+        work_queue.clear()
+
+        self.clear(entities_removed)
         self._current_id = 0
 
-        for player in player_manager.values():
-            player.total_mines_planted = 0
+        player_manager.reset_round_counters()
 
     def destroy_all(self):
-        for trip_mine in tuple(self):
+        for trip_mine in tuple(self.values()):
             trip_mine.destroy()
 
+        work_queue.flush()
+        entity_pool.clear()
         self._current_id = 0
 
 trip_mine_manager = TripMineManager()
+metrics.register_gauge('live_mines', trip_mine_manager.__len__)
+metrics.register_gauge('active_beams', trip_mine_manager.count_active_beams)
+beep_batch = BeepBatch(BEEP_MERGE_CELL_SIZE)
+
+
+def flush_beeps():
+    for trip_mine in beep_batch.pop_groups():
+        if trip_mine.prop is None:
+            continue
+
+        play_sound(
+            Sound(config.beep_sound,
+                  index=trip_mine.prop.index,
+                  attenuation=Attenuation.STATIC),
+            trip_mine.origin,
+            config.beep_sound_radius
+        )
+
+timer_wheel.batch_callbacks.append(flush_beeps)
+
+
+def open_journal(map_name):
+    # One journal file per map
+    journal.close()
+    if not config.journal_enable:
+        return
+
+    makedirs(JOURNAL_PATH, exist_ok=True)
+
+    # Zero or negative capacity would break every write, and with it
+    # planting and detonation
+    journal.open(
+        JOURNAL_PATH / "{}_{}.tmj".format(map_name, strftime("%Y%m%d_%H%M%S")),
+        max(1, config.journal_capacity)
+    )
+
+
+def add_downloadables():
+    with open(PLUGIN_DATA_PATH / info.basename / "downloadlist.res") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            _downloadables.add(line)
+
+
+def get_player_records():
+    return [
+        [player.player.userid, player.mines,
+         player_manager.mines_planted[player.index], player.last_mine_time]
+        for player in player_manager.values()
+    ]
+
+
+def save_for_reload():
+    # Let queued spawns and releases finish so that every mine has its
+    # entities and every free triple is hidden
+    work_queue.flush()
+
+    save_reload_state(
+        global_vars.map_name,
+        [trip_mine.to_record() for trip_mine in trip_mine_manager.values()
+         if trip_mine.entities is not None],
+        get_player_records()
+    )
+
+    # Entities are kept, only our own bookkeeping goes away
+    trip_mine_manager.reset()
+
+
+def restore_after_reload():
+    # Entities of pooled triples and of mines that can't be restored
+    # (their owner has left in the meantime) go back to the pool
+    entities_by_slot = entity_pool.find_existing()
+
+    state = pop_reload_state(global_vars.map_name)
+    if state is not None:
+        for userid, mines, mines_planted, last_mine_time in state[
+                'players']:
+
+            try:
+                player = player_manager.by_index[index_from_userid(userid)]
+            except ValueError:
+                continue
+
+            if player is None:
+                continue
+
+            player.mines = mines
+            player_manager.mines_planted[player.index] = mines_planted
+            player.last_mine_time = last_mine_time
+
+        for record in state['mines']:
+            slot, userid = record[0], record[2]
+            entities = entities_by_slot.get(slot)
+            if entities is None:
+                continue
+
+            try:
+                owner = player_manager.by_index[index_from_userid(userid)]
+            except ValueError:
+                continue
+
+            if owner is None:
+                continue
+
+            trip_mine_manager.restore(record, owner.player, entities)
+            del entities_by_slot[slot]
+
+    for entities in entities_by_slot.values():
+        entity_pool.release(entities)
+
+    return len(trip_mine_manager)
 
 
 def load():
+    start_time = perf_counter()
+
+    add_downloadables()
+    open_journal(global_vars.map_name)
+
     InternalEvent.fire('load')
+
+    restored = restore_after_reload()
+    entity_pool.prewarm()
+
     broadcast(strings['load'])
 
+    _load_timings[:] = (start_time - _import_start_time,
+                        perf_counter() - start_time)
+
+    echo_console("TripMines: imported in {:.1f} ms, loaded in {:.1f} ms, "
+                 "{} mines restored".format(_load_timings[0] * 1000,
+                                            _load_timings[1] * 1000,
+                                            restored))
+
 
 def unload():
-    trip_mine_manager.destroy_all()
+    if _reloading:
+        save_for_reload()
+    else:
+        trip_mine_manager.destroy_all()
+
+    journal.close()
 
     global _announcement_delay
     if _announcement_delay is not None and _announcement_delay.running:
@@ -379,77 +781,219 @@ def unload():
     broadcast(strings['unload'])
 
 
+def count_denial(reason):
+    metrics.increment(DENIAL_METRIC_NAMES[reason])
+
+
+def get_denial(reason):
+    count_denial(reason)
+    return strings[reason]
+
+
 def get_mine_denial_reason(player):
-    if not config_manager['enable']:
-        return strings['fail disabled']
+    if not config.enable:
+        return get_denial('fail disabled')
 
-    if time() - player.last_mine_time <= config_manager['plant_timeout']:
-        return strings['fail too_soon']
+    if time() - player.last_mine_time <= config.plant_timeout:
+        return get_denial('fail too_soon')
 
     if player.player.dead:
-        return strings['fail dead']
+        return get_denial('fail dead')
 
-    if player.player.team not in (teams_by_name['t'], teams_by_name['ct']):
-        return strings['fail wrong_team']
+    if player.player.team not in config.playable_teams:
+        return get_denial('fail wrong_team')
 
-    if config_manager['mines_stock'] != -1 and player.mines <= 0:
-        return strings['fail no_mines']
+    if config.mines_stock != -1 and player.mines <= 0:
+        return get_denial('fail no_mines')
 
-    if player.total_mines_planted >= config_manager['mines_limit'] > 0:
-        return strings['fail too_many']
+    if player_manager.mines_planted[player.index] >= config.mines_limit > 0:
+        return get_denial('fail too_many')
 
     return None
 
 
+def is_too_close_to_other_mines(origin):
+    min_spacing = config.min_spacing
+    return (min_spacing > 0 and
+            trip_mine_manager.has_mines_within_radius(origin, min_spacing))
+
+
 def use_mine(player, end_position, normal):
     player.mines -= 1
-    player.total_mines_planted += 1
+    player_manager.mines_planted[player.index] += 1
     player.last_mine_time = time()
+    stats_store.record(player.index, 'planted')
+    metrics.increment('plants')
 
     # Negative mines number indicates that infinite mines are turned on
     if player.mines >= 0:
-        tell(player, strings['mines_left'].tokenize(mines=player.mines))
+        tell(player, strings['mines_left'], mines=player.mines)
 
-    trip_mine_manager.create( player.player, end_position, normal)
+    trip_mine_manager.create(player.player, end_position, normal)
+
+
+def deny(player, reason, now):
+    if player_manager.should_tell_denial(player.index, reason, now):
+        tell(player, reason)
 
 
 def try_use_mine(player):
+    # Attempts over the rate limit are dropped before any trace or string
+    # work is done
+    now = time()
+    if not player_manager.take_attempt_token(player.index, now):
+        metrics.increment('attempts_dropped')
+        return
+
     reason = get_mine_denial_reason(player)
     if reason is not None:
-        tell(player, reason)
+        deny(player, reason, now)
         return
 
     trace = player.player.get_trace_ray()
     distance = (trace.end_position - player.player.origin).length
-    if distance > config_manager['plant_distance']:
-        tell(player, strings['fail too_far'])
+    if distance > config.plant_distance:
+        deny(player, get_denial('fail too_far'), now)
+        return
+
+    if is_too_close_to_other_mines(trace.end_position):
+        deny(player, get_denial('fail too_close'), now)
         return
 
     use_mine(player, trace.end_position, trace.plane.normal)
 
 
-@OnEntityOutput
+# Not registered with @OnEntityOutput: TripMineManager only attaches it while
+# there are active touch beams, so outputs fired by map logic cost nothing in
+# Python the rest of the time
+@profiler.profiled('entity_output')
 def listener_on_entity_output(output_name, activator, caller, value, delay):
-    if output_name != "OnTouchedByEntity":
+    if output_name != "OnTouchedByEntity" or caller is None:
         return
 
-    if not isinstance(caller, Entity) or not isinstance(activator, Entity):
-        return
-
-    try:
-        trip_mine = trip_mine_manager.get_by_beam_index(caller.index)
-    except IndexError:
+    trip_mine = trip_mine_manager.by_touch_beam_index.get(caller.index)
+    if trip_mine is None or not isinstance(activator, Entity):
         return
 
     trip_mine.on_touched_by_entity(activator)
 
 
+@OnLevelInit
+def listener_on_level_init(map_name):
+    open_journal(map_name)
+
+
+@OnLevelShutdown
+def listener_on_level_shutdown():
+    # Entities of these mines are about to be removed and their indexes
+    # reused on the next map - neither collision checks nor transmit culling
+    # may touch them after this point
+    trip_mine_manager.reset()
+
+
+@OnTick
+def listener_on_tick():
+    trip_mine_manager.check_beam_collisions()
+    trip_mine_manager.transmit_culler.update()
+
+
 @OnClientDisconnect
 def listener_on_client_disconnect(index):
+    _plant_buttons_held.discard(index)
+    trip_mine_manager.transmit_culler.remove_viewer(index)
+
     for trip_mine in tuple(trip_mine_manager.iter_by_owner_index(index)):
         trip_mine.destroy()
 
 
+@ServerCommand('tm_stats')
+def server_tm_stats(command):
+    action = command[1] if len(command) > 1 else ""
+    if action == "on":
+        profiler.enabled = True
+    elif action == "off":
+        profiler.enabled = False
+    elif action == "reset":
+        profiler.reset()
+
+    echo_console("TripMines profiling is {} (tm_stats on|off|reset)".format(
+        "on" if profiler.enabled else "off"))
+
+    echo_console("{:<14} {:>9} {:>11} {:>9} {:>9} {:>9}".format(
+        "section", "calls", "total ms", "p50 us", "p99 us", "max us"))
+
+    for name, section in sorted(profiler.sections.items()):
+        echo_console(STATS_ROW_FORMAT.format(
+            name,
+            section.calls,
+            section.total_time / 1e6,
+            section.get_percentile(0.5) / 1e3,
+            section.get_percentile(0.99) / 1e3,
+            section.max_time / 1e3,
+        ))
+
+    active_beams = trip_mine_manager.count_active_beams()
+    echo_console(
+        "Live mines: {}, active beams: {}, pending timers: {}".format(
+            len(trip_mine_manager), active_beams, len(timer_wheel)))
+
+    echo_console(
+        "Mine entities: {} in use, {} pooled, {} created in total".format(
+            len(trip_mine_manager) * 3,
+            len(entity_pool) * 3,
+            entity_pool.total_created * 3,
+        ))
+
+    dropped_attempts = player_manager.dropped_attempts
+    dropped_denials = player_manager.dropped_denials
+    players = sorted(
+        player_manager.values(),
+        key=lambda player: (
+            dropped_attempts[player.index] + dropped_denials[player.index]),
+        reverse=True)
+
+    echo_console(
+        "Rate limiting: {} plant attempts and {} denial messages "
+        "dropped".format(
+            sum(dropped_attempts[player.index] for player in players),
+            sum(dropped_denials[player.index] for player in players),
+        ))
+
+    for player in players[:STATS_TOP_DROPPERS]:
+        index = player.index
+        if not dropped_attempts[index] and not dropped_denials[index]:
+            break
+
+        echo_console("  {:<32} {:>8} attempts {:>8} messages".format(
+            player.player.name, dropped_attempts[index],
+            dropped_denials[index]))
+
+    echo_console("Metrics exporter: {}, {} packets sent, {} errors".format(
+        "running" if metrics.running else "stopped",
+        metrics.sent_packets,
+        metrics.send_errors,
+    ))
+
+    echo_console("Plugin imported in {:.1f} ms, loaded in {:.1f} ms".format(
+        _load_timings[0] * 1000, _load_timings[1] * 1000))
+
+    echo_console(
+        "Stats writer: {}, {} rows written, {} records dropped".format(
+            "running" if stats_store.running else "stopped",
+            stats_store.written,
+            stats_store.dropped,
+        ))
+
+
+@ServerCommand('tm_reload')
+def server_tm_reload(command):
+    # Planted mines and players' stock survive this reload
+    global _reloading
+    _reloading = True
+
+    queue_command_string("sp plugin reload {}".format(info.basename))
+
+
 @ClientCommand('+tripmine')
 def client_tripmine(command, index):
     try_use_mine(player_manager[index])
@@ -458,20 +1002,25 @@ def client_tripmine(command, index):
 @InternalEvent('player_respawn')
 def on_player_respawn(event_var):
     player = event_var['player']
-    player.mines = config_manager['mines_stock']
+    player.mines = config.mines_stock
 
 
 @Event('round_start')
 def on_round_start(game_event):
-    trip_mine_manager.reset()
+    # Round restart has already removed the entities of all mines
+    trip_mine_manager.reset(entities_removed=True)
+
+    # Round restart has removed all pooled entities, spawn fresh ones
+    entity_pool.invalidate()
+    entity_pool.prewarm()
 
     global _announcement_delay
     if _announcement_delay is not None and _announcement_delay.running:
         _announcement_delay.cancel()
 
-    if config_manager['announcement_delay'] >= 0:
+    if config.announcement_delay >= 0:
         _announcement_delay = Delay(
-            config_manager['announcement_delay'],
+            config.announcement_delay,
             broadcast,
             strings['announcement']
         )
@@ -479,7 +1028,7 @@ def on_round_start(game_event):
 
 @Event('player_death')
 def on_player_death(game_event):
-    if not config_manager['remove_on_death']:
+    if not config.remove_on_death:
         return
 
     index = index_from_userid(game_event['userid'])
@@ -488,22 +1037,40 @@ def on_player_death(game_event):
 
 
 @EntityPreHook(EntityCondition.is_human_player, 'run_command')
+@profiler.profiled('run_command')
 def pre_run_command(args):
-    player = player_manager[make_object(Player, args[0]).index]
+    # This runs for every human player on every tick, so until TAB+E is
+    # actually pressed it only costs an index lookup, a UserCmd wrapper and
+    # a set check - no Player instance, no player_manager lookup.
+    # Everything else only happens on the tick the combination goes down.
+    index = index_from_pointer(args[0])
+
+    if make_object(UserCmd, args[1]).buttons & PLANT_BUTTONS != PLANT_BUTTONS:
+        _plant_buttons_held.discard(index)
+        return
 
-    user_cmd = make_object(UserCmd, args[1])
+    if index in _plant_buttons_held:
+        return
 
-    if not (user_cmd.buttons & PlayerButtons.SCORE and
-            user_cmd.buttons & PlayerButtons.USE):
+    _plant_buttons_held.add(index)
 
+    if not player_manager.take_attempt_token(index, time()):
+        metrics.increment('attempts_dropped')
         return
 
+    player = player_manager.by_index[index]
+
     if get_mine_denial_reason(player) is not None:
         return
 
     trace = player.player.get_trace_ray()
     distance = (trace.end_position - player.player.origin).length
-    if distance > config_manager['plant_distance']:
+    if distance > config.plant_distance:
+        count_denial('fail too_far')
+        return
+
+    if is_too_close_to_other_mines(trace.end_position):
+        count_denial('fail too_close')
         return
 
     use_mine(player, trace.end_position, trace.plane.normal)
@@ -512,26 +1079,23 @@ def pre_run_command(args):
 @EntityPreHook(
     EntityCondition.equals_entity_classname('prop_physics_override'),
     'on_take_damage')
+@profiler.profiled('take_damage')
 def pre_take_damage(args):
-    victim_entity = make_object(Entity, args[0])
-    try:
-        victim_trip_mine = trip_mine_manager.get_by_prop_index(
-            victim_entity.index)
-    except IndexError:
+    # Every prop_physics_override on the map ends up here, so anything that
+    # is not one of our props is rejected with a single dict lookup
+    victim_trip_mine = trip_mine_manager.by_prop_address.get(args[0].address)
+    if victim_trip_mine is None:
         return
 
     if not victim_trip_mine.activated:
         return False
 
-    info = make_object(TakeDamageInfo, args[1])
-
-    if info.attacker == WORLD_ENTITY_INDEX:
-        return False
+    # Only players can destroy mines (this also rules out the world)
+    attacker_player = player_manager.get(
+        make_object(TakeDamageInfo, args[1]).attacker)
 
-    attacker_entity = Entity(info.attacker)
-    if attacker_entity.classname != 'player':
+    if attacker_player is None:
         return False
 
-    attacker_player = player_manager[info.attacker]
     victim_trip_mine.on_prop_damaged(attacker_player.player)
     return False
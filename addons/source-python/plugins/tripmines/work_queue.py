@@ -0,0 +1,61 @@
+from collections import deque
+from time import perf_counter
+from traceback import format_exc
+
+from core import echo_console
+from listeners import OnLevelShutdown, OnTick
+
+from .cvars import config
+
+
+# Entity spawns, key value setup and removals that would otherwise all
+# happen in one tick (round transitions, mass plants, owner deaths) are
+# queued here and spread over several ticks within a time and operation
+# budget per tick
+class WorkQueue:
+    def __init__(self):
+        self._jobs = deque()
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def add(self, callback, *args):
+        self._jobs.append((callback, args))
+
+    def _run_job(self):
+        callback, args = self._jobs.popleft()
+        try:
+            callback(*args)
+        except Exception:
+            echo_console(format_exc())
+
+    def run(self):
+        if not self._jobs:
+            return
+
+        deadline = perf_counter() + config.work_budget_ms / 1000
+        for i in range(max(1, config.work_budget_ops)):
+            self._run_job()
+
+            if not self._jobs or perf_counter() >= deadline:
+                break
+
+    def flush(self):
+        while self._jobs:
+            self._run_job()
+
+    def clear(self):
+        self._jobs.clear()
+
+work_queue = WorkQueue()
+
+
+@OnTick
+def listener_on_tick():
+    work_queue.run()
+
+
+@OnLevelShutdown
+def listener_on_level_shutdown():
+    # Whatever the jobs refer to is about to be removed by the engine
+    work_queue.clear()
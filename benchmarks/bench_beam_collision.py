@@ -0,0 +1,100 @@
+"""Speed: tick-based beam collision pass vs testing every player-beam pair.
+
+Beams are spread over a map-sized area the way mines get planted - from a
+wall, mostly horizontal, up to 1024 units long - and players stand at random
+spots of the same area. Both passes must report the same crossed beams.
+
+Usage: python benchmarks/bench_beam_collision.py [--players N]
+       [--beams N [N ...]] [--number N] [--seed N]
+"""
+import random
+from argparse import ArgumentParser
+from timeit import timeit
+
+import standins
+
+
+MAP_SIZE = 4096.0
+MAP_HEIGHT = 512.0
+PLAYER_HEIGHT = 72.0
+
+
+def random_beam(rng):
+    start = (
+        rng.uniform(0, MAP_SIZE),
+        rng.uniform(0, MAP_SIZE),
+        rng.uniform(0, MAP_HEIGHT),
+    )
+    length = rng.uniform(64, 1024)
+    if rng.random() < 0.5:
+        direction = (rng.choice((-1, 1)), 0, 0)
+    else:
+        direction = (0, rng.choice((-1, 1)), 0)
+
+    end = tuple(a + b * length for a, b in zip(start, direction))
+    return start, end
+
+
+def brute_force(beams, xs, ys, zs, heights, segment_intersects_box):
+    hits = {}
+    for number, (x, y, z, height) in enumerate(zip(xs, ys, zs, heights)):
+        mins = (x - 16, y - 16, z)
+        maxs = (x + 16, y + 16, z + height)
+        for key, (start, end) in beams.items():
+            if key not in hits and segment_intersects_box(
+                    start, end, mins, maxs):
+
+                hits[key] = number
+
+    return hits
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', type=int, default=64)
+    parser.add_argument('--beams', type=int, nargs='+',
+                        default=[100, 500, 2000])
+    parser.add_argument('--number', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    standins.install()
+    from tripmines.beam_collision import BeamCollisionEngine
+    from tripmines.spatial import segment_intersects_box
+
+    rng = random.Random(args.seed)
+    xs = [rng.uniform(0, MAP_SIZE) for i in range(args.players)]
+    ys = [rng.uniform(0, MAP_SIZE) for i in range(args.players)]
+    zs = [rng.uniform(0, MAP_HEIGHT) for i in range(args.players)]
+    heights = [PLAYER_HEIGHT] * args.players
+
+    print("{:>6} {:>6} {:>14} {:>14} {:>10}".format(
+        "beams", "hits", "pairs, us", "grid pass, us", "speedup"))
+
+    for beam_count in args.beams:
+        beams = {key: random_beam(rng) for key in range(beam_count)}
+        engine = BeamCollisionEngine(128.0)
+        for key, (start, end) in beams.items():
+            engine.add(key, start, end)
+
+        hits = engine.collide(xs, ys, zs, heights)
+        expected = brute_force(
+            beams, xs, ys, zs, heights, segment_intersects_box)
+        if set(hits) != set(expected):
+            raise AssertionError("Grid pass disagrees with brute force")
+
+        brute_force_time = timeit(
+            lambda: brute_force(
+                beams, xs, ys, zs, heights, segment_intersects_box),
+            number=max(1, args.number // 10)) / max(1, args.number // 10)
+        engine_time = timeit(
+            lambda: engine.collide(xs, ys, zs, heights),
+            number=args.number) / args.number
+
+        print("{:>6} {:>6} {:>14.1f} {:>14.1f} {:>9.1f}x".format(
+            beam_count, len(hits), brute_force_time * 1e6,
+            engine_time * 1e6, brute_force_time / engine_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Microbenchmark: config snapshot attribute reads vs controlled cvar reads.
+
+Runs on plain CPython with the stand-ins from standins.py; the stand-in
+config manager goes through the same steps as the real one on every read
+(name lookup, ConVar access and handler conversion), which is what the
+snapshot saves.
+
+Usage: python benchmarks/bench_config.py [--number N]
+"""
+from argparse import ArgumentParser
+from timeit import timeit
+
+import standins
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=1000000)
+    args = parser.parse_args()
+
+    standins.install()
+    from tripmines.cvars import config, config_manager
+
+    cases = (
+        ("float", "config_manager['damage_falloff_multiplier']",
+         "config.damage_falloff_multiplier"),
+        ("bool", "config_manager['allow_teamkill']",
+         "config.allow_teamkill"),
+        ("sound check", "config_manager['beep_sound'] != ''",
+         "config.beep_sound_enabled"),
+    )
+    namespace = {'config': config, 'config_manager': config_manager}
+
+    print("{:<12} {:>14} {:>14} {:>9}".format(
+        "read", "manager, ns", "snapshot, ns", "speedup"))
+
+    for name, manager_stmt, snapshot_stmt in cases:
+        manager_time = timeit(
+            manager_stmt, globals=namespace, number=args.number)
+        snapshot_time = timeit(
+            snapshot_stmt, globals=namespace, number=args.number)
+
+        print("{:<12} {:>14.1f} {:>14.1f} {:>8.1f}x".format(
+            name,
+            manager_time / args.number * 1e9,
+            snapshot_time / args.number * 1e9,
+            manager_time / snapshot_time,
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Memory and speed: slotted TripMinePlayer vs the previous plain classes.
+
+The previous TripMinePlayer (plain object with a __dict__) and the round
+reset that walked every player are reproduced below for comparison. Round
+and rate limiting counters of the slotted version live in per-index arrays
+of the player manager; their size per index is reported separately (the
+previous classes had no rate limiting at all).
+
+Usage: python benchmarks/bench_player_state.py [--players N] [--number N]
+"""
+import tracemalloc
+from argparse import ArgumentParser
+from array import array
+from timeit import timeit
+from types import SimpleNamespace
+
+import standins
+
+
+class LegacyTripMinePlayer:
+    def __init__(self, player):
+        self.player = player
+        self.mines = 0
+        self.last_mine_time = 0
+        self.total_mines_planted = 0
+
+
+class LegacyTripMinePlayerManager(dict):
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+
+
+def legacy_reset(players):
+    for player in players.values():
+        player.total_mines_planted = 0
+
+
+def measure_memory(factory, count):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    records = [factory(index) for index in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'lineno'))
+    del records
+    return size / count
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', type=int, default=64)
+    parser.add_argument('--number', type=int, default=200000)
+    args = parser.parse_args()
+
+    standins.install()
+    from tripmines.trip_mine_player import player_manager, TripMinePlayer
+
+    entities = [
+        SimpleNamespace(
+            index=index, language='en', name='player{}'.format(index),
+            steamid='STEAM_1:0:{}'.format(index))
+        for index in range(1, args.players + 1)
+    ]
+
+    legacy_players = LegacyTripMinePlayerManager()
+    for entity in entities:
+        legacy_players[entity.index] = LegacyTripMinePlayer(entity)
+
+    player_manager.register_many(
+        TripMinePlayer(entity) for entity in entities)
+
+    memory_count = 10000
+    legacy_memory = measure_memory(
+        lambda index: LegacyTripMinePlayer(entities[0]), memory_count)
+    slotted_memory = measure_memory(
+        lambda index: TripMinePlayer(entities[0]), memory_count)
+
+    print("{:<34} {:>12} {:>12}".format("", "legacy", "slotted"))
+    print("{:<34} {:>12.0f} {:>12.0f}".format(
+        "bytes per player record", legacy_memory, slotted_memory))
+
+    # Typed arrays plus a pointer per index in each list of counters
+    counters_memory = sum(
+        counters.itemsize if isinstance(counters, array) else 8
+        for name, counters in vars(player_manager).items()
+        if name != 'by_index' and isinstance(counters, (array, list)))
+
+    print("{:<34} {:>12.0f} {:>12.0f}".format(
+        "bytes of counters per index", 0, counters_memory))
+
+    index = args.players // 2
+    legacy_player = legacy_players[index]
+    slotted_player = player_manager.by_index[index]
+    namespace = {
+        'legacy_players': legacy_players,
+        'legacy_player': legacy_player,
+        'legacy_reset': legacy_reset,
+        'player_manager': player_manager,
+        'by_index': player_manager.by_index,
+        'slotted_player': slotted_player,
+        'index': index,
+    }
+
+    cases = (
+        ("index lookup, ns",
+         "legacy_players[index]",
+         "by_index[index]"),
+        ("plant bookkeeping, ns",
+         "legacy_player.mines -= 1; "
+         "legacy_player.total_mines_planted += 1",
+         "slotted_player.mines -= 1; "
+         "player_manager.mines_planted[index] += 1"),
+        ("round reset, ns",
+         "legacy_reset(legacy_players)",
+         "player_manager.reset_round_counters()"),
+    )
+    for name, legacy_stmt, slotted_stmt in cases:
+        legacy_time = timeit(
+            legacy_stmt, globals=namespace, number=args.number)
+        slotted_time = timeit(
+            slotted_stmt, globals=namespace, number=args.number)
+
+        print("{:<34} {:>12.1f} {:>12.1f}".format(
+            name,
+            legacy_time / args.number * 1e9,
+            slotted_time / args.number * 1e9,
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""Headless microbenchmarks of the plugin's hot paths.
+
+Every case runs for every combination of --players and --mines on the
+stand-in server (see standins.py and fixtures.py). Results are nanoseconds
+per call, best of --repeat runs. They can be saved as JSON, and compared
+against a previously saved baseline: cases that got slower by more than
+--threshold are flagged, and the exit code is 1 if there are any.
+
+Usage: python benchmarks/bench_suite.py [--players N [N ...]]
+       [--mines N [N ...]] [--number N] [--repeat N] [--seed N]
+       [--output FILE] [--baseline FILE] [--threshold FRACTION]
+"""
+import json
+import platform
+import random
+import sys
+from argparse import ArgumentParser
+from time import perf_counter_ns
+from timeit import Timer
+
+import standins
+
+
+def build_cases(players, trip_mines, rng):
+    # name -> (statement, setup or None); a setup is run before every
+    # single call of a statement that changes the state it measures.
+    # 'reset' goes last, it replaces every mine.
+    from fixtures import plant_mines
+    from standins import Pointer, PlayerButtons, TakeDamageInfo, UserCmd
+    from tripmines.strings import strings
+    from tripmines.trip_mine_player import broadcast, player_manager, tell
+    from tripmines.tripmines import (
+        _plant_buttons_held, get_mine_denial_reason, pre_run_command,
+        pre_take_damage, trip_mine_manager)
+
+    player = player_manager.by_index[players[0].index]
+    player.mines = 3
+    denied_player = player_manager.by_index[players[-1].index]
+    denied_player.mines = 0
+
+    trip_mine = rng.choice(trip_mines)
+    origin = trip_mine.origin
+    beam_index = trip_mine.beam.index
+
+    idle_args = (player.player.pointer, UserCmd(0))
+    held_args = (
+        player.player.pointer,
+        UserCmd(int(PlayerButtons.SCORE | PlayerButtons.USE)))
+    denied_args = (
+        denied_player.player.pointer,
+        UserCmd(int(PlayerButtons.SCORE | PlayerButtons.USE)))
+
+    attack = TakeDamageInfo()
+    attack.attacker = player.index
+    other_prop_args = (Pointer(10 ** 6), attack)
+    inactive_mine = plant_mines(1, rng, activate=False)[0]
+    inactive_mine_args = (inactive_mine.prop.pointer, attack)
+
+    def hold_buttons():
+        _plant_buttons_held.add(player.index)
+
+    def release_buttons():
+        _plant_buttons_held.discard(denied_player.index)
+
+    def plant_again():
+        trip_mine_manager.reset()
+        plant_mines(len(trip_mines), rng)
+
+    return {
+        'manager.get_by_beam_index': (
+            lambda: trip_mine_manager.get_by_beam_index(beam_index), None),
+        'manager.get_within_radius': (
+            lambda: trip_mine_manager.get_within_radius(origin, 256.0),
+            None),
+        'manager.has_mines_within_radius': (
+            lambda: trip_mine_manager.has_mines_within_radius(origin, 32.0),
+            None),
+        'pre_run_command.idle': (
+            lambda: pre_run_command(idle_args), None),
+        'pre_run_command.held': (
+            lambda: pre_run_command(held_args), hold_buttons),
+        'pre_run_command.denied': (
+            lambda: pre_run_command(denied_args), release_buttons),
+        'pre_take_damage.other_prop': (
+            lambda: pre_take_damage(other_prop_args), None),
+        'pre_take_damage.inactive_mine': (
+            lambda: pre_take_damage(inactive_mine_args), None),
+        'hurt_around': (
+            lambda: trip_mine._hurt_around(), None),
+        'get_mine_denial_reason.allowed': (
+            lambda: get_mine_denial_reason(player), None),
+        'get_mine_denial_reason.denied': (
+            lambda: get_mine_denial_reason(denied_player), None),
+        'tell': (
+            lambda: tell(player, strings['mines_left'], mines=3), None),
+        'broadcast': (
+            lambda: broadcast(strings['load']), None),
+        'reset': (
+            trip_mine_manager.reset, plant_again),
+    }
+
+
+def measure(statement, setup, number, repeat):
+    if setup is None:
+        timer = Timer(statement)
+        return min(timer.repeat(repeat, number)) / number * 1e9
+
+    # State is rebuilt before every call, only the call itself is timed
+    best = None
+    for i in range(repeat):
+        total = 0
+        for j in range(number):
+            setup()
+            start_time = perf_counter_ns()
+            statement()
+            total += perf_counter_ns() - start_time
+
+        if best is None or total < best:
+            best = total
+
+    return best / number
+
+
+def run(args):
+    from fixtures import add_players, clear_server, plant_mines, set_cvar
+
+    # Keep background threads, files and rate limiting out of the picture
+    set_cvar('stats_enable', 0)
+    set_cvar('attempt_rate', 0)
+
+    results = {}
+    for player_count in args.players:
+        for mine_count in args.mines:
+            rng = random.Random(args.seed)
+            clear_server()
+            players = add_players(player_count, rng, health=10 ** 9)
+            trip_mines = plant_mines(mine_count, rng)
+
+            cases = build_cases(players, trip_mines, rng)
+            for name, (statement, setup) in cases.items():
+                # Rebuilding the whole server is expensive, do it less often
+                number = args.number if setup is None else max(
+                    1, args.number // 1000)
+
+                key = "{}[players={},mines={}]".format(
+                    name, player_count, mine_count)
+
+                results[key] = measure(statement, setup, number, args.repeat)
+                print("{:<60} {:>14.1f} ns".format(key, results[key]),
+                      flush=True)
+
+    clear_server()
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = 0
+    print()
+    print("{:<60} {:>12} {:>12} {:>8}".format(
+        "case", "baseline", "current", "change"))
+
+    for key, value in results.items():
+        base_value = baseline.get(key)
+        if base_value is None:
+            print("{:<60} {:>12} {:>12.1f} {:>8}".format(
+                key, "-", value, "new"))
+
+            continue
+
+        change = value / base_value - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+
+        print("{:<60} {:>12.1f} {:>12.1f} {:>+7.1%}{}".format(
+            key, base_value, value, change, flag))
+
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', type=int, nargs='+', default=[16, 64])
+    parser.add_argument('--mines', type=int, nargs='+',
+                        default=[10, 100, 500])
+    parser.add_argument('--number', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Save results to this JSON file")
+    parser.add_argument('--baseline',
+                        help="Compare results with this JSON file")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Slowdown that counts as a regression "
+                             "(0.10 means 10%%)")
+    args = parser.parse_args()
+
+    standins.install()
+    results = run(args)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'number': args.number,
+                'repeat': args.repeat,
+                'seed': args.seed,
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("\n{} regression(s) over {:.0%}".format(
+                regressions, args.threshold))
+
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
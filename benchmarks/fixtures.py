@@ -0,0 +1,78 @@
+"""Puts fake players and planted mines on the stand-in server.
+
+Everything goes through the plugin's own code paths (client activation,
+TripMineManager.create, the work queue and activation), so what ends up in
+the plugin's indexes is what a real server would have. standins.install()
+must have been called first.
+"""
+from standins import Entity, Player, TEAMS_BY_NAME, Vector
+
+
+MAP_SIZE = 4096.0
+MAP_HEIGHT = 512.0
+
+
+def random_origin(rng):
+    return Vector(
+        rng.uniform(0, MAP_SIZE),
+        rng.uniform(0, MAP_SIZE),
+        rng.uniform(0, MAP_HEIGHT),
+    )
+
+
+def add_players(count, rng, health=100):
+    from tripmines.trip_mine_player import listener_on_client_active
+
+    players = []
+    for index in range(1, count + 1):
+        team = TEAMS_BY_NAME['t'] if index % 2 else TEAMS_BY_NAME['ct']
+        player = Player.add(index, team, random_origin(rng))
+        player.health = health
+        listener_on_client_active(index)
+        players.append(player)
+
+    return players
+
+
+def plant_mines(count, rng, activate=True):
+    from tripmines.timer_wheel import timer_wheel
+    from tripmines.tripmines import trip_mine_manager
+    from tripmines.work_queue import work_queue
+
+    owners = tuple(Player.players.values())
+    trip_mines = []
+    for i in range(count):
+        direction = rng.choice(((1, 0), (-1, 0), (0, 1), (0, -1)))
+        trip_mines.append(trip_mine_manager.create(
+            rng.choice(owners),
+            random_origin(rng),
+            Vector(float(direction[0]), float(direction[1]), 0.0)
+        ))
+
+    # Spawn entities right away instead of a few per tick
+    work_queue.flush()
+
+    if activate:
+        for trip_mine in trip_mines:
+            timer_wheel.cancel(trip_mine)
+            trip_mine._activate()
+
+    return trip_mines
+
+
+def clear_server():
+    from tripmines.trip_mine_player import player_manager
+    from tripmines.tripmines import trip_mine_manager
+
+    trip_mine_manager.destroy_all()
+    trip_mine_manager.reset()
+    player_manager.unregister_all()
+    Player.remove_all()
+    Entity.entities.clear()
+
+
+def set_cvar(name, value):
+    from tripmines.cvars import config, config_manager
+
+    config_manager.cvars[name].convar.set_string(value)
+    config.refresh()
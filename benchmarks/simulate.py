@@ -0,0 +1,587 @@
+"""Replays synthetic rounds against the plugin on the stand-in server.
+
+A scenario file (JSON, see scenarios/) describes the server: player count,
+tick rate, map bounds, how often players plant, shoot mines, die and
+disconnect, and which cvars to set. Players walk around the map, press
+TAB+E, walk through beams and shoot props. The stand-in engine fires the
+plugin's hooks, listeners and game events for all of that, and everything
+the plugin does within a tick is timed. The same scenario and seed always
+play out the same way: randomness comes from the seed and the plugin's
+clock is the simulated one.
+
+Reported: plugin time per tick (percentiles, ticks over the budget), peak
+live mines, beams, entities and pending timers, and peak memory.
+
+Usage: python benchmarks/simulate.py SCENARIO [--seed N] [--rounds N]
+       [--profile] [--trace-memory] [--output FILE]
+"""
+import json
+import platform
+import random
+import tracemalloc
+from argparse import ArgumentParser
+from math import cos, pi, sin
+from pathlib import Path
+from time import perf_counter, perf_counter_ns
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+import standins
+
+
+SCENARIO_DEFAULTS = {
+    'name': None,
+    'description': "",
+    'seed': 0,
+    'tick_rate': 64,
+    'rounds': 3,
+
+    # Seconds; a round also ends once only one team has anybody alive
+    'round_time': 60.0,
+    'players': 24,
+
+    # [mins, maxs]; players walk on random heights within them
+    'map_bounds': [[0.0, 0.0, 0.0], [4096.0, 4096.0, 256.0]],
+
+    # Units per second
+    'move_speed': 250.0,
+
+    # Per player per minute of being alive (connected for disconnects)
+    'plant_rate': 2.0,
+    'shoot_rate': 4.0,
+    'death_rate': 0.5,
+    'disconnect_rate': 0.05,
+
+    # Only mines this close to the shooter are shot at
+    'shoot_range': 1024.0,
+
+    # Seconds before a disconnected player joins again; they stay dead
+    # until the next round
+    'reconnect_delay': 15.0,
+
+    # Plugin time per tick above this is counted as over budget;
+    # None means 5% of the tick interval
+    'tick_budget_ms': None,
+
+    # tm_ cvars (without the prefix) -> value
+    'cvars': {},
+}
+
+# Seconds TAB+E is held down for once pressed
+PLANT_HOLD_TIME = 0.25
+
+# Distance to the wall players plant on, see standins.DEFAULT_AIM_OFFSET
+AIM_DISTANCE = 48.0
+AIM_HEIGHT = 40.0
+
+# Plugin's time() returns simulated seconds counted from here
+SIMULATION_EPOCH = 1.0e9
+
+PERCENTILES = (0.5, 0.9, 0.99, 0.999)
+
+BEAM_CLASSNAME = 'env_beam'
+PROP_CLASSNAME = 'prop_physics_override'
+
+
+def load_scenario(path):
+    with open(path) as f:
+        scenario = json.load(f)
+
+    unknown = set(scenario) - set(SCENARIO_DEFAULTS)
+    if unknown:
+        raise ValueError("Unknown scenario keys: {}".format(
+            ", ".join(sorted(unknown))))
+
+    result = dict(SCENARIO_DEFAULTS)
+    result.update(scenario)
+    if result['name'] is None:
+        result['name'] = Path(path).stem
+
+    return result
+
+
+def get_percentile(sorted_values, percentile):
+    if not sorted_values:
+        return 0
+
+    return sorted_values[min(
+        len(sorted_values) - 1, int(percentile * len(sorted_values)))]
+
+
+class Simulation:
+    def __init__(self, scenario, seed):
+        self.scenario = scenario
+        self.rng = random.Random(seed)
+
+        self.global_vars = standins.install()
+        self.global_vars.interval_per_tick = 1 / scenario['tick_rate']
+        self.global_vars.current_time = SIMULATION_EPOCH
+
+        from fixtures import set_cvar
+        from listeners import on_entity_output_listener_manager
+        from tripmines import tripmines as plugin
+        from tripmines.beam_collision import BeamCollisionEngine
+
+        # The plugin reads wall clock time for plant timeouts and rate
+        # limiting, make it follow the simulation instead
+        plugin.time = lambda: self.global_vars.current_time
+
+        self.plugin = plugin
+        self.output_listeners = on_entity_output_listener_manager
+        for name, value in scenario['cvars'].items():
+            set_cvar(name, value)
+
+        # Per tick chances of things players do
+        minute_ticks = 60 * scenario['tick_rate']
+        self.plant_chance = scenario['plant_rate'] / minute_ticks
+        self.shoot_chance = scenario['shoot_rate'] / minute_ticks
+        self.death_chance = scenario['death_rate'] / minute_ticks
+        self.disconnect_chance = scenario['disconnect_rate'] / minute_ticks
+
+        self.step = scenario['move_speed'] / scenario['tick_rate']
+        self.plant_hold_ticks = max(
+            1, int(PLANT_HOLD_TIME * scenario['tick_rate']))
+
+        self.round_ticks = int(scenario['round_time'] * scenario['tick_rate'])
+        self.mins, self.maxs = scenario['map_bounds']
+
+        # Engine side of touch beams: TouchType beams that are on
+        self.touch_beams = BeamCollisionEngine(
+            plugin.SPATIAL_CELL_SIZE)
+
+        self.beam_segments = {}
+
+        self.alive = set()
+        self.headings = {}
+        self.plant_buttons = {}
+
+        # index -> tick to join again on
+        self.reconnects = {}
+
+        self.tick_time = 0
+        self.tick_times = []
+        self.counters = dict.fromkeys((
+            'rounds', 'plant_presses', 'mines_planted', 'shots',
+            'mines_detonated', 'mine_deaths', 'other_deaths',
+            'disconnects', 'reconnects',
+        ), 0)
+
+        self.peaks = dict.fromkeys((
+            'live_mines', 'active_beams', 'entities', 'pooled_entities',
+            'pending_timers',
+        ), 0)
+
+    def call(self, function, *args, **kwargs):
+        # Plugin code, counted towards the tick's time
+        start_time = perf_counter_ns()
+        result = function(*args, **kwargs)
+        self.tick_time += perf_counter_ns() - start_time
+        return result
+
+    def random_origin(self):
+        return standins.Vector(*(
+            self.rng.uniform(low, high)
+            for low, high in zip(self.mins, self.maxs)))
+
+    def add_player(self, index):
+        team = standins.TEAMS_BY_NAME['t' if index % 2 else 'ct']
+        player = standins.Player.add(index, team, self.random_origin())
+        self.headings[index] = self.rng.uniform(0, 2 * pi)
+        return player
+
+    def start(self):
+        for index in range(1, self.scenario['players'] + 1):
+            self.add_player(index)
+
+        self.plugin.load()
+
+    def start_round(self):
+        self.counters['rounds'] += 1
+
+        # Round restart removes every entity the plugin has spawned
+        standins.Entity.cleanup()
+        self.call(standins.Event.fire, 'round_start')
+
+        for index, tick in tuple(self.reconnects.items()):
+            if tick <= self.global_vars.tick_count:
+                del self.reconnects[index]
+                self.add_player(index)
+                self.call(standins.LISTENERS['OnClientActive'].fire, index)
+                self.counters['reconnects'] += 1
+
+        for index, player in standins.Player.players.items():
+            player.respawn(self.random_origin())
+            self.alive.add(index)
+            self.call(standins.Event.fire, 'player_spawn',
+                      userid=player.userid)
+
+    def is_round_over(self, round_tick):
+        if round_tick >= self.round_ticks:
+            return True
+
+        teams = {standins.Player.players[index].team for index in self.alive}
+        return len(teams) < 2
+
+    def move_players(self):
+        rng = self.rng
+        step = self.step
+        for index in sorted(self.alive):
+            player = standins.Player.players[index]
+            heading = self.headings[index] + rng.gauss(0, 0.1)
+            origin = player.origin
+            x = origin.x + cos(heading) * step
+            y = origin.y + sin(heading) * step
+
+            # Turn around at the map bounds
+            if not self.mins[0] <= x <= self.maxs[0]:
+                heading = pi - heading
+                x = origin.x
+
+            if not self.mins[1] <= y <= self.maxs[1]:
+                heading = -heading
+                y = origin.y
+
+            self.headings[index] = heading
+            player.origin = standins.Vector(x, y, origin.z)
+
+    def run_commands(self):
+        # The run_command hook is called for every human player every tick
+        trip_mine_manager = self.plugin.trip_mine_manager
+        pre_run_command = self.plugin.pre_run_command
+        plant_buttons = int(self.plugin.PLANT_BUTTONS)
+        for index, player in tuple(standins.Player.players.items()):
+            held_ticks = self.plant_buttons.get(index, 0)
+            if held_ticks:
+                self.plant_buttons[index] = held_ticks - 1
+            elif (index in self.alive and
+                    self.rng.random() < self.plant_chance):
+
+                held_ticks = self.plant_buttons[index] = (
+                    self.plant_hold_ticks)
+
+                angle = self.rng.uniform(0, 2 * pi)
+                player.aim_offset = standins.Vector(
+                    cos(angle) * AIM_DISTANCE, sin(angle) * AIM_DISTANCE,
+                    AIM_HEIGHT)
+
+                self.counters['plant_presses'] += 1
+
+            user_cmd = standins.UserCmd(plant_buttons if held_ticks else 0)
+            live_mines = len(trip_mine_manager)
+            self.call(pre_run_command, (player.pointer, user_cmd))
+            if len(trip_mine_manager) > live_mines:
+                self.counters['mines_planted'] += 1
+
+    def sync_touch_beams(self, entities):
+        segments = {}
+        for entity in entities:
+            if (entity.classname == BEAM_CLASSNAME and entity.turned_on and
+                    entity.key_values.get('TouchType')):
+
+                start = entity.properties['m_vecEndPos']
+                end = entity.origin
+                segments[entity] = (
+                    (start.x, start.y, start.z), (end.x, end.y, end.z))
+
+        for entity, segment in self.beam_segments.items():
+            if segments.get(entity) != segment:
+                self.touch_beams.remove(entity)
+
+        for entity, segment in segments.items():
+            if self.beam_segments.get(entity) != segment:
+                self.touch_beams.add(entity, *segment)
+
+        self.beam_segments = segments
+
+    def fire_touch_outputs(self, entities):
+        self.sync_touch_beams(entities)
+        if not self.beam_segments:
+            return
+
+        players = [standins.Player.players[index]
+                   for index in sorted(self.alive)]
+
+        hits = self.touch_beams.collide(
+            [player.origin.x for player in players],
+            [player.origin.y for player in players],
+            [player.origin.z for player in players],
+            [player.maxs.z for player in players],
+        )
+
+        for beam, number in hits.items():
+            for listener in tuple(self.output_listeners):
+                self.call(listener, 'OnTouchedByEntity', players[number],
+                          beam, None, 0.0)
+
+    def shoot_mines(self, entities):
+        props = [entity for entity in entities
+                 if entity.classname == PROP_CLASSNAME and
+                 not entity.effects & standins.EntityEffects.NODRAW]
+
+        if not props:
+            return
+
+        shoot_range = self.scenario['shoot_range']
+        for index in sorted(self.alive):
+            if self.rng.random() >= self.shoot_chance:
+                continue
+
+            player = standins.Player.players[index]
+            if player.dead:
+                continue
+
+            targets = [prop for prop in props
+                       if (prop.origin - player.origin).length <=
+                       shoot_range]
+
+            if not targets:
+                continue
+
+            take_damage_info = standins.TakeDamageInfo()
+            take_damage_info.attacker = index
+            take_damage_info.damage = 30
+            self.counters['shots'] += 1
+            self.call(self.plugin.pre_take_damage,
+                      (self.rng.choice(targets).pointer, take_damage_info))
+
+    def report_deaths(self, counter):
+        for index in sorted(self.alive):
+            player = standins.Player.players[index]
+            if player.dead:
+                self.alive.discard(index)
+                self.counters[counter] += 1
+                self.call(standins.Event.fire, 'player_death',
+                          userid=player.userid)
+
+    def kill_players(self):
+        for index in sorted(self.alive):
+            if self.rng.random() < self.death_chance:
+                player = standins.Player.players[index]
+                player.health = 0
+                player.dead = True
+
+        self.report_deaths('other_deaths')
+
+    def disconnect_players(self):
+        rejoin_tick = self.global_vars.tick_count + int(
+            self.scenario['reconnect_delay'] * self.scenario['tick_rate'])
+
+        for index in tuple(standins.Player.players):
+            if self.rng.random() >= self.disconnect_chance:
+                continue
+
+            self.call(standins.LISTENERS['OnClientDisconnect'].fire, index)
+            standins.Player.disconnect(index)
+            self.alive.discard(index)
+            self.plant_buttons.pop(index, None)
+            self.reconnects[index] = rejoin_tick
+            self.counters['disconnects'] += 1
+
+    def update_peaks(self):
+        trip_mine_manager = self.plugin.trip_mine_manager
+        peaks = self.peaks
+        values = (
+            ('live_mines', len(trip_mine_manager)),
+            ('active_beams', trip_mine_manager.count_active_beams()),
+            ('entities', len(standins.Entity.entities) -
+             len(standins.Player.players)),
+            ('pooled_entities', len(self.plugin.entity_pool) * 3),
+            ('pending_timers', len(self.plugin.timer_wheel)),
+        )
+
+        for name, value in values:
+            if value > peaks[name]:
+                peaks[name] = value
+
+    def run_tick(self, round_tick):
+        global_vars = self.global_vars
+        global_vars.tick_count += 1
+        global_vars.current_time += global_vars.interval_per_tick
+        self.tick_time = 0
+
+        if round_tick == 0:
+            self.start_round()
+
+        self.move_players()
+        self.run_commands()
+
+        entities = tuple(standins.Entity.entities.values())
+        live_mines = len(self.plugin.trip_mine_manager)
+        self.fire_touch_outputs(entities)
+        self.shoot_mines(entities)
+        self.call(standins.LISTENERS['OnTick'].fire)
+        self.counters['mines_detonated'] += max(
+            0, live_mines - len(self.plugin.trip_mine_manager))
+
+        self.report_deaths('mine_deaths')
+        self.kill_players()
+        self.disconnect_players()
+
+        self.tick_times.append(self.tick_time)
+        self.update_peaks()
+
+    def run(self, rounds):
+        self.start()
+        for round_number in range(rounds):
+            round_tick = 0
+            while True:
+                self.run_tick(round_tick)
+                round_tick += 1
+                if self.is_round_over(round_tick):
+                    break
+
+        self.plugin.unload()
+
+    def get_results(self):
+        tick_interval_us = self.global_vars.interval_per_tick * 1e6
+        budget_ms = self.scenario['tick_budget_ms']
+        if budget_ms is None:
+            budget_us = tick_interval_us * 0.05
+        else:
+            budget_us = budget_ms * 1000
+
+        tick_times = sorted(time / 1000 for time in self.tick_times)
+        over_budget = sum(1 for time in tick_times if time > budget_us)
+
+        results = {
+            'ticks': len(tick_times),
+            'simulated_seconds': len(tick_times) / self.scenario['tick_rate'],
+            'tick_interval_us': tick_interval_us,
+            'budget_us': budget_us,
+            'ticks_over_budget': over_budget,
+            'tick_time_us': {
+                'mean': sum(tick_times) / max(1, len(tick_times)),
+            },
+            'counters': self.counters,
+            'peaks': self.peaks,
+        }
+
+        for percentile in PERCENTILES:
+            results['tick_time_us']['p{:g}'.format(percentile * 100)] = (
+                get_percentile(tick_times, percentile))
+
+        results['tick_time_us']['max'] = tick_times[-1] if tick_times else 0
+        return results
+
+
+def print_results(scenario, results, wall_time):
+    print("Scenario {}: {} players, {} ticks/s, {} ticks ({:.0f} s "
+          "simulated in {:.1f} s)".format(
+              scenario['name'], scenario['players'], scenario['tick_rate'],
+              results['ticks'], results['simulated_seconds'], wall_time))
+
+    print()
+    print("Plugin time per tick, us (tick interval {:.0f} us, "
+          "budget {:.0f} us)".format(
+              results['tick_interval_us'], results['budget_us']))
+
+    for name, value in results['tick_time_us'].items():
+        print("  {:<8} {:>10.1f}  {:>6.2%} of the tick".format(
+            name, value, value / results['tick_interval_us']))
+
+    print("  {} ticks ({:.3%}) over budget".format(
+        results['ticks_over_budget'],
+        results['ticks_over_budget'] / max(1, results['ticks'])))
+
+    print()
+    print("Peaks")
+    for name, value in results['peaks'].items():
+        print("  {:<20} {:>10}".format(name, value))
+
+    for name, value in results['memory'].items():
+        print("  {:<20} {:>10.1f}".format(name, value))
+
+    print()
+    print("Counters")
+    for name, value in results['counters'].items():
+        print("  {:<20} {:>10}".format(name, value))
+
+
+def print_profile():
+    from tripmines.profiler import profiler
+
+    print()
+    print("{:<14} {:>9} {:>11} {:>9} {:>9} {:>9}".format(
+        "section", "calls", "total ms", "p50 us", "p99 us", "max us"))
+
+    for name, section in sorted(profiler.sections.items()):
+        if not section.calls:
+            continue
+
+        print("{:<14} {:>9} {:>11.1f} {:>9.1f} {:>9.1f} {:>9.1f}".format(
+            name,
+            section.calls,
+            section.total_time / 1e6,
+            section.get_percentile(0.5) / 1e3,
+            section.get_percentile(0.99) / 1e3,
+            section.max_time / 1e3,
+        ))
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('scenario', help="Scenario JSON file")
+    parser.add_argument('--seed', type=int,
+                        help="Overrides the scenario's seed")
+    parser.add_argument('--rounds', type=int,
+                        help="Overrides the scenario's number of rounds")
+    parser.add_argument('--profile', action='store_true',
+                        help="Also break plugin time down by hook "
+                             "(slows hooks down a little)")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Measure peak Python heap with tracemalloc "
+                             "(slows everything down a lot)")
+    parser.add_argument('--output', help="Save results to this JSON file")
+    args = parser.parse_args()
+
+    scenario = load_scenario(args.scenario)
+    seed = scenario['seed'] if args.seed is None else args.seed
+    rounds = scenario['rounds'] if args.rounds is None else args.rounds
+
+    if args.trace_memory:
+        tracemalloc.start()
+
+    simulation = Simulation(scenario, seed)
+    if args.profile:
+        from tripmines.profiler import profiler
+        profiler.enabled = True
+
+    start_time = perf_counter()
+    simulation.run(rounds)
+    wall_time = perf_counter() - start_time
+
+    results = simulation.get_results()
+    results['memory'] = {}
+    if args.trace_memory:
+        results['memory']['python_heap_peak_mb'] = (
+            tracemalloc.get_traced_memory()[1] / 2 ** 20)
+
+        tracemalloc.stop()
+
+    if resource is not None:
+        # Kilobytes on Linux
+        results['memory']['max_rss_mb'] = resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    print_results(scenario, results, wall_time)
+    if args.profile:
+        print_profile()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'scenario': scenario,
+                'seed': seed,
+                'rounds': rounds,
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,609 @@
+"""Lightweight stand-ins for the Source.Python modules the plugin imports.
+
+They only model what the plugin touches, so that its hot paths can be
+imported and timed on plain CPython. install() must be called before
+importing anything from the tripmines package.
+
+Entities and players live in plain registries (Entity.entities,
+Player.players); Player.add() puts a fake player on the server. Traces
+always hit a wall TRACE_HIT_DISTANCE units away, players die when their
+health runs out and nothing is networked.
+
+Listeners (LISTENERS['OnTick'] and so on) and game events (Event) keep the
+callbacks the plugin registers, so a driver can fire them the way the
+engine would.
+"""
+import shutil
+import sys
+import tempfile
+import types
+from math import sqrt
+from pathlib import Path
+
+
+PLUGINS_PATH = (
+    Path(__file__).resolve().parent.parent /
+    'addons' / 'source-python' / 'plugins')
+
+DATA_PATH = PLUGINS_PATH.parent / 'data' / 'plugins'
+
+TEAMS_BY_NAME = {'un': 0, 'spec': 1, 't': 2, 'ct': 3}
+
+MAX_CLIENTS = 64
+
+# Every trace hits something this far from where it starts
+TRACE_HIT_DISTANCE = 512.0
+
+# Where players aim at, relative to their origin - a wall within planting
+# distance
+DEFAULT_AIM_OFFSET = (48.0, 0.0, 40.0)
+
+
+class Decorator:
+    # Command and hook decorators: register nothing, return the
+    # function untouched
+    def __init__(self, *args, **kwargs):
+        self.args = args
+
+    def __call__(self, function):
+        return function
+
+
+class Listener(list):
+    # @OnTick and the like: callbacks are kept in registration order
+    def __call__(self, callback):
+        self.append(callback)
+        return callback
+
+    def fire(self, *args):
+        for callback in tuple(self):
+            callback(*args)
+
+
+LISTENERS = {name: Listener() for name in (
+    'OnClientActive', 'OnClientDisconnect', 'OnConVarChanged', 'OnLevelInit',
+    'OnLevelShutdown', 'OnTick')}
+
+
+class Event:
+    # game event name -> callbacks
+    callbacks = {}
+
+    def __init__(self, *event_names):
+        self.event_names = event_names
+
+    def __call__(self, callback):
+        for event_name in self.event_names:
+            Event.callbacks.setdefault(event_name, []).append(callback)
+
+        return callback
+
+    @classmethod
+    def fire(cls, event_name, **event_variables):
+        for callback in tuple(cls.callbacks.get(event_name, ())):
+            callback(event_variables)
+
+
+class ConVar:
+    def __init__(self, name, default):
+        self.name = name
+        self._value = str(default)
+
+    def get_string(self):
+        return self._value
+
+    def get_int(self):
+        return int(float(self._value))
+
+    def get_float(self):
+        return float(self._value)
+
+    def set_string(self, value):
+        self._value = str(value)
+
+
+def bool_handler(convar):
+    return bool(convar.get_int())
+
+
+def int_handler(convar):
+    return convar.get_int()
+
+
+def float_handler(convar):
+    return convar.get_float()
+
+
+def string_handler(convar):
+    return convar.get_string()
+
+
+class ControlledConVar:
+    def __init__(self, handler, convar):
+        self.handler = handler
+        self.convar = convar
+
+    def get_value(self):
+        return self.handler(self.convar)
+
+
+class CfgPath(type(Path())):
+    # Path of the cfg file, which always exists as far as cvars.py knows
+    def isfile(self):
+        return True
+
+
+class ControlledConfigManager:
+    # Goes through the same steps as the real manager on every read:
+    # name lookup, ConVar access and handler conversion
+    def __init__(self, filepath, cvar_prefix=''):
+        self.cvar_prefix = cvar_prefix
+        self.cvars = {}
+        self.fullpath = CfgPath(filepath + '.cfg')
+
+    def controlled_cvar(self, handler, name, default=0, description=''):
+        self.cvars[name] = ControlledConVar(
+            handler, ConVar(self.cvar_prefix + name, default))
+
+    def __getitem__(self, name):
+        return self.cvars[name].get_value()
+
+    def write(self):
+        pass
+
+    def execute(self):
+        pass
+
+
+class GlobalVars:
+    def __init__(self):
+        self.tick_count = 0
+        self.interval_per_tick = 1 / 64
+        self.max_clients = MAX_CLIENTS
+        self.current_time = 0.0
+        self.map_name = 'de_standin'
+
+
+class Vector:
+    __slots__ = ('x', 'y', 'z')
+
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = x
+        self.y = y
+        self.z = z
+
+    def __iter__(self):
+        return iter((self.x, self.y, self.z))
+
+    def __add__(self, other):
+        return Vector(self.x + other.x, self.y + other.y, self.z + other.z)
+
+    def __sub__(self, other):
+        return Vector(self.x - other.x, self.y - other.y, self.z - other.z)
+
+    def __mul__(self, scalar):
+        return Vector(self.x * scalar, self.y * scalar, self.z * scalar)
+
+    def __eq__(self, other):
+        return tuple(self) == tuple(other)
+
+    def __repr__(self):
+        return 'Vector({}, {}, {})'.format(self.x, self.y, self.z)
+
+    @property
+    def length(self):
+        return sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
+
+    def normalized(self):
+        length = self.length
+        if not length:
+            return Vector()
+
+        return self * (1 / length)
+
+
+class Pointer:
+    __slots__ = ('address', 'index')
+
+    def __init__(self, index):
+        self.address = 0x10000 + index * 0x100
+        self.index = index
+
+
+class EntityEffects:
+    NODRAW = 32
+
+
+class DamageTypes:
+    BLAST = 64
+
+
+class TakeDamageInfo:
+    def __init__(self):
+        self.attacker = 0
+        self.damage = 0
+        self.type = 0
+
+
+class Entity:
+    # index -> entity, every entity that hasn't been removed
+    entities = {}
+    _next_index = MAX_CLIENTS + 1
+
+    def __init__(self, classname, index):
+        self.classname = classname
+        self.index = index
+        self.pointer = Pointer(index)
+        self.target_name = ''
+        self.origin = Vector()
+        self.model = None
+        self.spawn_flags = 0
+        self.solid_type = 0
+        self.collision_group = 0
+        self.effects = 0
+        self.key_values = {}
+        self.properties = {}
+        self.turned_on = False
+
+    @classmethod
+    def create(cls, classname):
+        entity = cls(classname, cls._next_index)
+        cls._next_index += 1
+        cls.entities[entity.index] = entity
+        return entity
+
+    def teleport(self, origin=None, angles=None, velocity=None):
+        if origin is not None:
+            self.origin = origin
+
+    def spawn(self):
+        pass
+
+    def set_key_value_float(self, name, value):
+        self.key_values[name] = value
+
+    set_key_value_int = set_key_value_float
+    set_key_value_string = set_key_value_float
+    set_key_value_color = set_key_value_float
+
+    def set_property_vector(self, name, value):
+        self.properties[name] = value
+
+    def call_input(self, name, *args):
+        if name == 'TurnOn':
+            self.turned_on = True
+        elif name == 'TurnOff':
+            self.turned_on = False
+
+    def on_take_damage(self, take_damage_info):
+        pass
+
+    def remove(self):
+        Entity.entities.pop(self.index, None)
+
+    @classmethod
+    def cleanup(cls):
+        # Round restart: every entity but players is removed
+        for index in tuple(cls.entities):
+            if index not in Player.players:
+                del cls.entities[index]
+
+
+class GameTrace:
+    def __init__(self):
+        self.end_position = Vector()
+        self.plane = types.SimpleNamespace(normal=Vector(-1.0, 0.0, 0.0))
+
+    def did_hit(self):
+        return True
+
+
+class Ray:
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+
+
+class EngineTrace:
+    def __init__(self):
+        self.traces = 0
+
+    def trace_ray(self, ray, mask, trace_filter, trace):
+        self.traces += 1
+        direction = (ray.end - ray.start).normalized()
+        trace.end_position = ray.start + direction * TRACE_HIT_DISTANCE
+        trace.plane.normal = direction * -1
+
+
+class Player(Entity):
+    # index -> player, everybody on the server
+    players = {}
+
+    def __new__(cls, index):
+        # Player(index) returns the one and only instance, as far as the
+        # plugin can tell
+        return cls.players[index]
+
+    def __init__(self, index):
+        pass
+
+    @classmethod
+    def add(cls, index, team, origin, language='en', bot=False):
+        player = object.__new__(cls)
+        Entity.__init__(player, 'player', index)
+        player.userid = index
+        player.steamid = 'BOT' if bot else 'STEAM_1:0:{}'.format(index)
+        player.name = 'player{}'.format(index)
+        player.language = language
+        player.team = team
+        player.origin = origin
+        player.maxs = Vector(16.0, 16.0, 72.0)
+        player.aim_offset = Vector(*DEFAULT_AIM_OFFSET)
+        player.health = 100
+        player.dead = False
+        player.damage_taken = 0
+
+        cls.players[index] = player
+        Entity.entities[index] = player
+        return player
+
+    @classmethod
+    def remove_all(cls):
+        for index in cls.players:
+            Entity.entities.pop(index, None)
+
+        cls.players.clear()
+
+    @classmethod
+    def disconnect(cls, index):
+        Entity.entities.pop(index, None)
+        del cls.players[index]
+
+    def get_trace_ray(self):
+        # A wall facing the player
+        trace = GameTrace()
+        trace.end_position = self.origin + self.aim_offset
+        aim = self.aim_offset.normalized()
+        trace.plane.normal = Vector(-aim.x, -aim.y, 0.0).normalized()
+        return trace
+
+    def on_take_damage(self, take_damage_info):
+        self.damage_taken += take_damage_info.damage
+        self.health -= take_damage_info.damage
+        if self.health <= 0:
+            self.dead = True
+
+    def respawn(self, origin=None):
+        if origin is not None:
+            self.origin = origin
+
+        self.health = 100
+        self.dead = False
+
+    def is_fake_client(self):
+        return self.steamid == 'BOT'
+
+
+def index_from_userid(userid):
+    if userid not in Player.players:
+        raise ValueError("Invalid userid {}".format(userid))
+
+    return userid
+
+
+class UserCmd:
+    def __init__(self, buttons=0):
+        self.buttons = buttons
+
+
+class PlayerButtons:
+    USE = 1 << 5
+    SCORE = 1 << 16
+
+
+def make_object(cls, pointer):
+    # Hooks are called with the stand-in objects themselves
+    return pointer
+
+
+class EntityCondition:
+    @staticmethod
+    def is_human_player(entity):
+        return entity.classname == 'player'
+
+    @staticmethod
+    def equals_entity_classname(*classnames):
+        return lambda entity: entity.classname in classnames
+
+
+class OutputListenerManager(set):
+    def register_listener(self, listener):
+        self.add(listener)
+
+    def unregister_listener(self, listener):
+        self.remove(listener)
+
+
+class TransmitManager:
+    def __init__(self):
+        self.hidden = set()
+
+    def hide_from(self, index, player_index):
+        self.hidden.add((index, player_index))
+
+    def reset_from(self, index, player_index):
+        self.hidden.discard((index, player_index))
+
+    def reset(self, index):
+        self.hidden = {item for item in self.hidden if item[0] != index}
+
+
+class Sound:
+    played = 0
+
+    def __init__(self, sample, index=0, attenuation=None, origin=None,
+                 direction=None):
+        self.sample = sample
+
+    def play(self, *player_indexes):
+        Sound.played += 1
+
+
+class Delay:
+    def __init__(self, delay, callback, *args, **kwargs):
+        self.running = False
+
+    def cancel(self):
+        self.running = False
+
+
+class Model:
+    def __init__(self, path):
+        self.path = path
+        self.index = 1
+
+
+class Color(tuple):
+    def __new__(cls, r, g, b, a=255):
+        return super().__new__(cls, (r, g, b, a))
+
+    def __str__(self):
+        return '\x07{:02X}{:02X}{:02X}'.format(*self[:3])
+
+
+class TranslationStrings(dict):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tokens = {}
+
+    def tokenize(self, **tokens):
+        result = TranslationStrings(self)
+        result.tokens = dict(self.tokens, **tokens)
+        return result
+
+    def get_string(self, language=None, **tokens):
+        text = self.get(language) or self['en']
+        tokens = dict(self.tokens, **tokens)
+        for key, value in tokens.items():
+            if isinstance(value, TranslationStrings):
+                tokens[key] = value.get_string(language)
+            else:
+                tokens[key] = str(value)
+
+        return text.format(**tokens)
+
+
+class BaseLangStrings(dict):
+    # Reads the plugin's translation file the same way LangStrings does
+    def __init__(self, infile):
+        super().__init__()
+
+        path = (
+            PLUGINS_PATH.parent.parent.parent / 'resource' /
+            'source-python' / 'translations' / (infile + '.ini'))
+
+        section = None
+        for line in path.read_text(encoding='utf-8').splitlines():
+            line = line.strip()
+            if line.startswith('[') and line.endswith(']'):
+                section = self[line[1:-1]] = TranslationStrings()
+            elif '=' in line and section is not None:
+                language, text = line.split('=', 1)
+                section[language.strip()] = text.strip().strip('"')
+
+
+class SayText2:
+    sent = 0
+
+    def __init__(self, message=''):
+        self.message = message
+
+    def send(self, *player_indexes):
+        SayText2.sent += 1
+
+
+def module(name, **attributes):
+    mod = sys.modules.get(name)
+    if mod is None:
+        mod = sys.modules[name] = types.ModuleType(name)
+
+        parent_name, _, child_name = name.rpartition('.')
+        if parent_name:
+            setattr(module(parent_name), child_name, mod)
+
+    mod.__dict__.update(attributes)
+    return mod
+
+
+def install():
+    global_vars = GlobalVars()
+
+    # Files the plugin writes for itself (cfg stamp, stats, journals) end up
+    # in a throwaway directory, next to a copy of the shipped ones
+    data_path = Path(tempfile.mkdtemp(prefix='tripmines-bench-'))
+    shutil.copytree(DATA_PATH / 'tripmines', data_path / 'tripmines')
+
+    module('advanced_ts', BaseLangStrings=BaseLangStrings)
+    module('colors', Color=Color)
+    module('commands.client', ClientCommand=Decorator)
+    module('commands.server', ServerCommand=Decorator)
+    module('controlled_cvars',
+           ControlledConfigManager=ControlledConfigManager)
+    module('controlled_cvars.handlers',
+           bool_handler=bool_handler, int_handler=int_handler,
+           float_handler=float_handler, string_handler=string_handler)
+    module('core', echo_console=lambda text: None)
+    module('cvars.public', PublicConVar=lambda *args: None)
+    module('effects', temp_entities=types.SimpleNamespace(
+        explosion=lambda *args: None))
+    module('engines.precache', Model=Model)
+    module('engines.server',
+           global_vars=global_vars,
+           queue_command_string=lambda command: None)
+    module('engines.sound',
+           Attenuation=types.SimpleNamespace(STATIC=0, NORMAL=1),
+           Sound=Sound,
+           SOUND_FROM_WORLD=0)
+    module('engines.trace',
+           ContentMasks=types.SimpleNamespace(ALL=-1),
+           engine_trace=EngineTrace(),
+           GameTrace=GameTrace,
+           MAX_TRACE_LENGTH=56755.84,
+           Ray=Ray,
+           TraceFilterSimple=lambda ignore=(): None)
+    module('entities', TakeDamageInfo=TakeDamageInfo)
+    module('entities.constants',
+           DamageTypes=DamageTypes, EntityEffects=EntityEffects)
+    module('entities.entity', Entity=Entity)
+    module('entities.helpers',
+           index_from_pointer=lambda pointer: pointer.index)
+    module('entities.hooks',
+           EntityCondition=EntityCondition, EntityPreHook=Decorator)
+    module('entities.transmit', transmit_manager=TransmitManager())
+    module('events', Event=Event)
+    module('filters.entities', EntityIter=lambda classnames: (
+        entity for entity in tuple(Entity.entities.values())
+        if entity.classname in classnames))
+    module('filters.players',
+           PlayerIter=lambda *args: iter(tuple(Player.players.values())))
+    module('filters.recipients', RecipientFilter=lambda *indexes: indexes)
+    module('listeners',
+           on_entity_output_listener_manager=OutputListenerManager(),
+           **LISTENERS)
+    module('listeners.tick', Delay=Delay)
+    module('mathlib', NULL_VECTOR=Vector(), Vector=Vector)
+    module('memory', make_object=make_object)
+    module('messages', SayText2=SayText2)
+    module('paths', PLUGIN_DATA_PATH=data_path)
+    module('players', UserCmd=UserCmd)
+    module('players.constants', PlayerButtons=PlayerButtons)
+    module('players.entity', Player=Player)
+    module('players.helpers', index_from_userid=index_from_userid)
+    module('players.teams', teams_by_name=dict(TEAMS_BY_NAME))
+    module('plugins.info', PluginInfo=types.SimpleNamespace)
+    module('stringtables.downloads', Downloadables=set)
+
+    if str(PLUGINS_PATH) not in sys.path:
+        sys.path.insert(0, str(PLUGINS_PATH))
+
+    return global_vars
@@ -0,0 +1,52 @@
+"""Stream records of a TripMines journal file as CSV or JSON lines.
+
+Records are read one at a time, oldest first, so journals of any size can
+be piped into other tools.
+
+Usage: python tools/read_journal.py JOURNAL [--format csv|jsonl]
+"""
+import csv
+import json
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+
+
+PLUGINS_PATH = (
+    Path(__file__).resolve().parent.parent /
+    'addons' / 'source-python' / 'plugins')
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('journal', type=Path)
+    parser.add_argument('--format', choices=('csv', 'jsonl'), default='csv')
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(PLUGINS_PATH))
+    from tripmines.journal import EVENT_NAMES, iter_journal, RECORD_FIELDS
+
+    event_field = RECORD_FIELDS.index('event')
+
+    if args.format == 'csv':
+        writer = csv.writer(sys.stdout)
+        writer.writerow(RECORD_FIELDS)
+        write = writer.writerow
+    else:
+        def write(row):
+            sys.stdout.write(json.dumps(dict(zip(RECORD_FIELDS, row))))
+            sys.stdout.write('\n')
+
+    for record in iter_journal(args.journal):
+        record = list(record)
+        record[event_field] = EVENT_NAMES.get(
+            record[event_field], record[event_field])
+
+        write(record)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except BrokenPipeError:
+        sys.stderr.close()
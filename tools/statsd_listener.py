@@ -0,0 +1,45 @@
+"""Stand-in statsd server: print every metric line received over UDP.
+
+Point the plugin at it with tm_metrics_host/tm_metrics_port, then watch
+the lines (and, with --verbose, packet sizes) as they arrive.
+
+Usage: python tools/statsd_listener.py [--host HOST] [--port PORT]
+       [--verbose]
+"""
+import socket
+from argparse import ArgumentParser
+
+
+MAX_PACKET_SIZE = 65535
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8125)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((args.host, args.port))
+    print("Listening on {}:{}".format(args.host, args.port), flush=True)
+
+    packets = 0
+    try:
+        while True:
+            data, address = sock.recvfrom(MAX_PACKET_SIZE)
+            packets += 1
+            if args.verbose:
+                print("# packet {} from {}:{}, {} bytes".format(
+                    packets, *address, len(data)), flush=True)
+
+            for line in data.decode('utf-8', 'replace').splitlines():
+                print(line, flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
+
+
+if __name__ == '__main__':
+    main()